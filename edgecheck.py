@@ -0,0 +1,233 @@
+"""Checks tilemap.separate_edges against its previous pairwise implementation on generated levels
+For the neighbourhood of every room and corridor both must give the same segments, none of which overlap
+Run directly: python edgecheck.py [number of levels]"""
+import sys
+import time
+from raycast import Edge
+from settings import NEIGHBOURHOODHOPS
+from tilemap import Map, get_corners, get_edges, separate_edges
+
+
+# Previous implementation of separate_edges, kept unchanged as the reference to check against
+def _reference_find_overlap_edges(edges):
+    """Returns a list of overlaps where each element in the list is a list of two or more edges
+    The first element in each of said list is the long edge (the room edge)
+    The following elements in list are corridor edges sorted by order of start pos
+    Where left most element is that of the furthest left/up edge start position"""
+    overlaps = []
+    has_overlapped = []
+    check_list = [*edges]
+
+    # Runs until all edges have been checked for overlaps
+    while len(check_list) != 0:
+        # Initialises variable to test for overlap
+        overlap = False
+        edge1 = check_list[0]
+
+        # Iterates over all remaining edges that have not yet been checked
+        for edge_count in range(1, len(check_list)):
+            edge2 = check_list[edge_count]
+
+            # Test if two edges are both travelling vertically and share a horizontal x start position
+            if edge1.dir_x == 0 and edge2.dir_x == 0 and edge1.start_x == edge2.start_x:
+                # Finds which edge is longer and assigns to variables as appropriate
+                long_edge = edge2
+                short_edge = edge1
+                if edge1.dir_y > edge2.dir_y:
+                    long_edge = edge1
+                    short_edge = edge2
+
+                # Check if the two edges overlap
+                if long_edge.start_y < short_edge.start_y and long_edge.end_y > short_edge.end_y:
+                    # If long edge has not overlapped with any other edges append the pair of edges to overlaps list
+                    if long_edge not in has_overlapped:
+                        overlaps.append([long_edge, short_edge])
+                    # Otherwise find's the edges existing overlap pair and appends new edge to the list
+                    else:
+                        for index, overlap in enumerate(overlaps):
+                            if overlap[0] == long_edge:
+                                overlap_index = index
+                                break
+                        # Edges are placed in length order within the overlap list
+                        if overlaps[overlap_index][1].start_y < short_edge.start_y:
+                            overlaps[overlap_index].append(short_edge)
+                        else:
+                            overlaps[overlap_index].insert(1, short_edge)
+                    # Removes the short edge from the check list
+                    check_list.remove(short_edge)
+                    overlap = True
+                    # Add long edge to the has overlapped list
+                    has_overlapped.append(long_edge)
+                    # Returns to outer loop
+                    break
+
+            # Test if two edges are both travelling horizontally and share a vertical y start position
+            elif edge1.dir_y == 0 and edge2.dir_y == 0 and edge1.start_y == edge2.start_y:
+                # Finds which edge is longer and assigns to variables as appropriate
+                long_edge = edge2
+                short_edge = edge1
+                if edge1.dir_x > edge2.dir_x:
+                    long_edge = edge1
+                    short_edge = edge2
+
+                # Check if the two edges overlap
+                if long_edge.start_x < short_edge.start_x and long_edge.end_x > short_edge.end_x:
+                    # If long edge has not overlapped with any other edges append the pair of edges to overlaps list
+                    if long_edge not in has_overlapped:
+                        overlaps.append([long_edge, short_edge])
+                    # Otherwise find's the edges existing overlap pair and appends new edge to the list
+                    else:
+                        for index, overlap in enumerate(overlaps):
+                            if overlap[0] == long_edge:
+                                overlap_index = index
+                                break
+                        # Edges are placed in length order within the overlap list
+                        if overlaps[overlap_index][1].dir_x < short_edge.dir_x:
+                            overlaps[overlap_index].insert(1, short_edge)
+                        else:
+                            overlaps[overlap_index].append(short_edge)
+                    # Removes the short edge from the check list
+                    check_list.remove(short_edge)
+                    overlap = True
+                    # Add long edge to the has overlapped list
+                    has_overlapped.append(long_edge)
+                    # Returns to outer loop
+                    break
+
+        # If no overlap between edges remove current inspected edge from the check list
+        if not overlap:
+            check_list.remove(edge1)
+
+    # Return all identified overlapping edge groups
+    return overlaps
+
+
+def reference_separate_edges(edges):
+    # Initialise final_edges to be all edges
+    final_edges = edges
+    overlaps = _reference_find_overlap_edges(edges)
+    # Remove any overlapping edges from list of final_edges
+    for overlap in overlaps:
+        for edge in overlap:
+            final_edges.remove(edge)
+
+    # Iterates over each overlap group found
+    for overlap in overlaps:
+        # Check if overlap featured vertical edges
+        if overlap[0].dir_x == 0:
+            # Initialise key points with the start pos of first edge in overlap list (which is the long edge)
+            key_points = [overlap[0].start_y]
+            # For all remaining edges in the overlap list, append start and end points to key_points list
+            # In order from highest point to lowest point
+            for overlap_edge in overlap[1:]:
+                p1 = overlap_edge.start_y
+                p2 = overlap_edge.end_y
+                if p1 < p2:
+                    key_points.append(p1)
+                    key_points.append(p2)
+                else:
+                    key_points.append(p2)
+                    key_points.append(p1)
+            key_points.append(overlap[0].end_y)
+
+            # Instantiate new edges for each pair of key points in key_points list
+            # Where first point in pair represents start point of new edge and second represents end point of new edge
+            # Append instantiated edge to list of final_edges
+            for kp_count in range(0, len(key_points), 2):
+                srt_pt_y = key_points[kp_count]
+                end_pt_y = key_points[kp_count + 1]
+                if srt_pt_y != end_pt_y:
+                    x_pos = overlap[0].start_x
+                    final_edges.append(Edge(x_pos, srt_pt_y, x_pos, end_pt_y))
+
+        # If overlap featured horizontal edges
+        else:
+            # Initialise key points with the start pos of first edge in overlap list (which is the long edge)
+            key_points = [overlap[0].start_x]
+            # For all remaining edges in the overlap list, append start and end points to key_points list
+            # In order from highest point to lowest point
+            for overlap_edge in overlap[1:]:
+                p1 = overlap_edge.start_x
+                p2 = overlap_edge.end_x
+                if p1 < p2:
+                    key_points.append(p1)
+                    key_points.append(p2)
+                else:
+                    key_points.append(p2)
+                    key_points.append(p1)
+            key_points.append(overlap[0].end_x)
+
+            # Instantiate new edges for each pair of key points in key_points list
+            # Where first point in pair represents start point of new edge and second represents end point of new edge
+            # Append instantiated edge to list of final_edges
+            for kp_count in range(0, len(key_points), 2):
+                srt_pt_x = key_points[kp_count]
+                end_pt_x = key_points[kp_count + 1]
+                if srt_pt_x != end_pt_x:
+                    y_pos = overlap[0].start_y
+                    final_edges.append(Edge(srt_pt_x, y_pos, end_pt_x, y_pos))
+
+    # Returns all the final edges which now feature no overlapping edges
+    return final_edges
+
+
+def get_segments(edges):
+    """Returns each edge as (axis, fixed coordinate, low, high), ignoring which way along its line it runs"""
+    segments = []
+    for edge in edges:
+        if edge.dir_x == 0:
+            segments.append(("V", edge.start_x, *sorted((edge.start_y, edge.end_y))))
+        else:
+            segments.append(("H", edge.start_y, *sorted((edge.start_x, edge.end_x))))
+    return sorted(segments)
+
+
+def has_overlaps(segments):
+    # Segments are sorted by line and then low coordinate, so only consecutive segments can overlap
+    for segment, next_segment in zip(segments, segments[1:]):
+        if segment[:2] == next_segment[:2] and next_segment[2] < segment[3]:
+            return True
+    return False
+
+
+def get_neighbourhood_edges(level, region):
+    edges = []
+    for near_region in level.get_neighbourhood(region, NEIGHBOURHOODHOPS):
+        edges.extend(get_edges(get_corners(near_region)))
+    return edges
+
+
+def run(num_levels):
+    checked = 0
+    failures = 0
+    elapsed = {"reference": 0, "sweep": 0}
+    for level_count in range(num_levels):
+        level = Map()
+        for region in level.get_regions():
+            # Each implementation is given its own copy of the edges, as the reference removes from its input
+            reference_edges = get_neighbourhood_edges(level, region)
+            edges = get_neighbourhood_edges(level, region)
+            timestamp = time.perf_counter()
+            reference_edges = reference_separate_edges(reference_edges)
+            elapsed["reference"] += time.perf_counter() - timestamp
+            timestamp = time.perf_counter()
+            edges = separate_edges(edges)
+            elapsed["sweep"] += time.perf_counter() - timestamp
+
+            reference_segments = get_segments(reference_edges)
+            segments = get_segments(edges)
+
+            checked += 1
+            if segments != reference_segments or has_overlaps(segments):
+                failures += 1
+                print("Edges differ around region at", region.get_pos(), "on level", level_count)
+        level.close()
+
+    print(f"{checked} edge sets checked, {failures} failed")
+    for name, seconds in elapsed.items():
+        print(f"{name:>9}: {seconds * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    levels = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    run(levels)
@@ -0,0 +1,106 @@
+# Multipliers that transform coordinates in the first octant into each of the 8 octants around the origin
+_OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+            (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+class FieldOfView:
+    """Per tile visibility bitmap around an origin tile, where the walls of a passability grid block sight
+    Only tiles within the radius are scanned, each octant being swept row by row outwards while tracking the
+    Slopes still visible past any walls, so the cost is proportional to the number of tiles that can be seen"""
+    def __init__(self, grid, radius):
+        self._width = grid.get_width()
+        self._height = grid.get_height()
+        # Row major cells of the grid, holding 0 for the walls that block sight
+        self._cells = grid.get_cells()
+        self._radius = radius
+        self._origin = None
+        # Row major bitmap holding 1 for visible tiles, along with the tiles set so it can be cleared cheaply
+        self._visible = bytearray(self._width * self._height)
+        self._visible_indexes = []
+
+    def update(self, origin):
+        """Recalculates the field of view from the origin tile, returns True if it was recalculated
+        Calculation is skipped if the origin is the same tile as before"""
+        origin = int(origin[0]), int(origin[1])
+        if origin == self._origin:
+            return False
+        self._origin = origin
+
+        for index in self._visible_indexes:
+            self._visible[index] = 0
+        self._visible_indexes = []
+
+        if not (0 <= origin[0] < self._width and 0 <= origin[1] < self._height):
+            return True
+        self._set_visible(*origin)
+        for xx, xy, yx, yy in _OCTANTS:
+            self._cast_light(1, 1.0, 0.0, xx, xy, yx, yy)
+        return True
+
+    def _set_visible(self, x_pos, y_pos):
+        index = y_pos * self._width + x_pos
+        if not self._visible[index]:
+            self._visible[index] = 1
+            self._visible_indexes.append(index)
+
+    def _is_blocking(self, x_pos, y_pos):
+        if 0 <= x_pos < self._width and 0 <= y_pos < self._height:
+            return self._cells[y_pos * self._width + x_pos] == 0
+        return True
+
+    def _cast_light(self, row, start_slope, end_slope, xx, xy, yx, yy):
+        """Sweeps one octant from the given row outwards, lighting tiles between the start and end slopes
+        When a wall interrupts the sweep the rows beyond it are scanned recursively with the narrowed slopes"""
+        if start_slope < end_slope:
+            return
+        origin_x, origin_y = self._origin
+        radius_squared = self._radius * self._radius
+        new_start_slope = start_slope
+        for distance in range(row, self._radius + 1):
+            blocked = False
+            y_change = -distance
+            for x_change in range(-distance, 1):
+                x_pos = origin_x + x_change * xx + y_change * xy
+                y_pos = origin_y + x_change * yx + y_change * yy
+                # Slopes of the left and right extremities of the tile
+                left_slope = (x_change - 0.5) / (y_change + 0.5)
+                right_slope = (x_change + 0.5) / (y_change - 0.5)
+                if start_slope < right_slope:
+                    continue
+                elif end_slope > left_slope:
+                    break
+
+                in_bounds = 0 <= x_pos < self._width and 0 <= y_pos < self._height
+                if in_bounds and x_change * x_change + y_change * y_change <= radius_squared:
+                    self._set_visible(x_pos, y_pos)
+
+                if blocked:
+                    if self._is_blocking(x_pos, y_pos):
+                        new_start_slope = right_slope
+                    else:
+                        blocked = False
+                        start_slope = new_start_slope
+                elif self._is_blocking(x_pos, y_pos) and distance < self._radius:
+                    # Wall starts a shadow, so the light before it continues in the next row on its own
+                    blocked = True
+                    self._cast_light(distance + 1, start_slope, left_slope, xx, xy, yx, yy)
+                    new_start_slope = right_slope
+            if blocked:
+                break
+
+    def is_visible(self, x_pos, y_pos):
+        """Returns True if the tile is within the field of view, checked in constant time"""
+        x_pos = int(x_pos)
+        y_pos = int(y_pos)
+        if 0 <= x_pos < self._width and 0 <= y_pos < self._height:
+            return self._visible[y_pos * self._width + x_pos] == 1
+        return False
+
+    def get_visibility_map(self):
+        return self._visible
+
+    def get_visible_tiles(self):
+        return [(index % self._width, index // self._width) for index in self._visible_indexes]
+
+    def get_origin(self):
+        return self._origin
@@ -5,6 +5,7 @@ from camera import *
 from tilemap import *
 from gui import *
 from raycast import *
+from fov import *
 from screens import *
 from settings import *
 from math import sqrt
@@ -49,6 +50,7 @@ class Game:
         self._s_heal = pg.mixer.Sound("sfx/heal.wav")
         self._s_heal.set_volume(1)
         self.db = databaseController()
+        self.map = None
 
     def new_game(self):
         self._comp_diff_score = 1
@@ -94,10 +96,18 @@ class Game:
         self.crates = pg.sprite.Group()
         self.exit = None
         self.player = None
+        if self.map is not None:
+            self.map.close()
+        # Enemy target tiles are reserved per level so the table starts empty each time
+        self.reservations = ReservationTable()
         self.map = Map()
         self.map.load_tilemap(self)
+        # Tile field of view around the player, only used for enemy visibility when ENEMYVISIBILITY is "fov"
+        self.fov = None
+        if ENEMYVISIBILITY == "fov":
+            self.fov = FieldOfView(self.map.get_passability_grid(), FOVRADIUS)
         self.prev_room = None
-        self.ray_source = RaySource(self.player.get_pos(), [], [])
+        self.ray_source = create_visibility_source(self.player.get_pos(), [], [])
         self.wall_surface = pg.Surface((self.map.get_pixelwidth(), self.map.get_pixelheight()))
         self.wall_surface.fill(DARKGREY)
 
@@ -127,12 +137,20 @@ class Game:
         self.crates = pg.sprite.Group()
         self.exit = None
         self.player = None
+        if self.map is not None:
+            self.map.close()
+        # Enemy target tiles are reserved per level so the table starts empty each time
+        self.reservations = ReservationTable()
         self.map = Map()
         self.map.load_tilemap(self)
+        # Tile field of view around the player, only used for enemy visibility when ENEMYVISIBILITY is "fov"
+        self.fov = None
+        if ENEMYVISIBILITY == "fov":
+            self.fov = FieldOfView(self.map.get_passability_grid(), FOVRADIUS)
         self.prev_room = None
         self.camera = Camera(self, self.player.pos.x, self.player.pos.y, WIDTH, HEIGHT)
         self.gui = GUIController(self, self.screen, self.camera)
-        self.ray_source = RaySource(self.player.get_pos(), [], [])
+        self.ray_source = create_visibility_source(self.player.get_pos(), [], [])
         self.wall_surface = pg.Surface((self.map.get_pixelwidth(), self.map.get_pixelheight()))
         self.wall_surface.fill(DARKGREY)
 
@@ -166,44 +184,33 @@ class Game:
 
     def update(self):
         # update portion of the game loop
+        self.map.clear_line_of_sight_cache()
+        # Queued enemy path requests are advanced within the per frame budget
+        if PATHMODE in ("scheduled", "batch"):
+            self.map.get_path_scheduler().update()
         self.all_sprites.update()
+        if ENEMYVISIBILITY == "fov":
+            self.fov.update(approximate_tile_pos(self.player))
         self.camera.set_pos(self.player.get_pos().x, self.player.get_pos().y)
 
 
         current_room = self.map.get_room_or_corridor((self.player.get_center_pos().x, self.player.get_center_pos().y))
         if current_room != self.prev_room:
-            # Player has moved to a new room
-            self.near_rooms = set(self.map.get_connected_rooms_corridors((self.player.get_center_pos().x, self.player.get_center_pos().y)))
-            self.near_rooms.add(current_room)
+            # Player has moved to a new room, enemies are active in it and the rooms and corridors next to it
+            self.active_rooms = set(self.map.get_neighbourhood(current_room, 1))
 
-            # Set enemies to be active/inactive
-            for enemy in self.enemies:
-                enemy_room = self.map.get_room_or_corridor((enemy.get_center_pos().x, enemy.get_center_pos().y))
-                enemy.set_active(enemy_room in self.near_rooms)
-                enemy.set_to_path(enemy_room in self.near_rooms and enemy_room != current_room)
-
-
-            near_room_copy = set([i for i in self.near_rooms])
-            for room in near_room_copy:
-                pos = self.map._get_random_pos(room)
-                temp_store = self.map.get_connected_rooms_corridors((pos[0]*TILESIZE, pos[1]*TILESIZE))
-                for item in temp_store:
-                    self.near_rooms.add(item)
-
-            # Update raytracing corners and edges as appropriate
-            self.near_corners = []
-            self.near_edges = []
-            for room in self.near_rooms:
-                self.corners = get_corners(room)
-                edges = get_edges(self.corners)
-                for edge in edges:
-                    self.near_edges.append(edge)
-                for corner in self.corners:
-                    self.near_corners.append(corner)
-
-            self.near_edges = separate_edges(self.near_edges)
-
-        self.ray_source.update(self.player.get_center_pos(), self.near_corners, self.near_edges)
+            # Set enemies to be active/inactive, classifying every enemy's room in one call
+            enemies = self.enemies.sprites()
+            enemy_rooms = self.map.get_rooms_or_corridors([enemy.get_center_pos() for enemy in enemies])
+            for enemy, enemy_room in zip(enemies, enemy_rooms):
+                enemy.set_active(enemy_room in self.active_rooms)
+                enemy.set_to_path(enemy_room in self.active_rooms and enemy_room != current_room)
+
+
+            # Update raytracing corners and edges to those precomputed for the room's neighbourhood
+            self.near_corners, self.near_edges, self.near_edge_array = self.map.get_occluders(current_room)
+
+        self.ray_source.update(self.player.get_center_pos(), self.near_corners, self.near_edges, self.near_edge_array)
         self.prev_room = current_room
 
 
@@ -211,24 +218,28 @@ class Game:
         if DEBUG:
             color = (random.randint(0,255),random.randint(0,255),random.randint(0,255))
             self.screen.fill(color)
-            self.visibilitySurface.fill(color)
         else:
             self.screen.fill(BGCOLOUR)
-            self.visibilitySurface.fill(BGCOLOUR)
 
         cam_offset = self.camera.get_offset()
         self.screen.blit(self.wall_surface, cam_offset)
+        # All enemies are tested against the visible regions in a single call
+        enemies = [sprite for sprite in self.all_sprites if type(sprite) == Enemy]
+        if ENEMYVISIBILITY == "fov":
+            enemies_visible = [self.fov.is_visible(*approximate_tile_pos(enemy)) for enemy in enemies]
+        else:
+            enemies_visible = self.ray_source.check_visible_many([tuple(enemy.get_pos()) for enemy in enemies])
+        for enemy, visible in zip(enemies, enemies_visible):
+            enemy.set_visible(visible)
         for sprite in self.all_sprites:
-            if type(sprite) == Enemy:
-                if not self.ray_source.check_visible(tuple(sprite.get_pos())):
-                    sprite.set_visible(False)
-                    continue
-                sprite.set_visible(True)
             if sprite.get_visible():
                 self.screen.blit(sprite.image, sprite.rect.move(cam_offset))
 
         self.gui.draw()
-        self.ray_source.draw_visible_regions(self.visibilitySurface, cam_offset)
+        # Overlay is kept between frames and only redrawn once the visible regions or camera offset change
+        if DEBUG or self.ray_source.needs_redraw(cam_offset):
+            self.visibilitySurface.fill(color if DEBUG else BGCOLOUR)
+            self.ray_source.draw_visible_regions(self.visibilitySurface, cam_offset)
 
         self.screen.blit(self.visibilitySurface, (0,0))
         if DEBUG:
@@ -330,7 +341,9 @@ class Game:
 environ['SDL_VIDEO_CENTERED'] = '1'
 
 # create the game object
-g = Game()
-g.show_start_screen()
+# Guarded so that worker processes of the batch path solver can import this module without starting a game
+if __name__ == "__main__":
+    g = Game()
+    g.show_start_screen()
 
 
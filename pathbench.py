@@ -0,0 +1,46 @@
+"""Compares the tile searches available to Pathfinder on generated levels
+Run directly: python pathbench.py [number of levels] [routes per level]"""
+import random
+import sys
+import time
+from levelgen import LevelGenerator
+from pathfind import Pathfinder, PassabilityGrid
+
+
+def get_room_tiles(generator):
+    tiles = []
+    for room in generator.get_rooms():
+        for x_pos in range(room.get_x() + 1, room.get_end_x()):
+            for y_pos in range(room.get_y() + 1, room.get_end_y()):
+                tiles.append((x_pos, y_pos))
+    return tiles
+
+
+def run(num_levels, num_routes, searches=("astar", "jps")):
+    expanded = {search: 0 for search in searches}
+    elapsed = {search: 0 for search in searches}
+    for level in range(num_levels):
+        generator = LevelGenerator(60, 50, 3, 0.2)
+        grid = PassabilityGrid(generator.get_layout())
+        tiles = get_room_tiles(generator)
+        for route in range(num_routes):
+            start_pos = random.choice(tiles)
+            end_pos = random.choice(tiles)
+            lengths = set()
+            for search in searches:
+                timestamp = time.perf_counter()
+                router = Pathfinder(start_pos, end_pos, grid, search)
+                elapsed[search] += time.perf_counter() - timestamp
+                expanded[search] += router.get_expanded_count()
+                lengths.add(router.get_shortest_route().length())
+            if len(lengths) != 1:
+                print("Route lengths differ between", start_pos, "and", end_pos, lengths)
+
+    for search in searches:
+        print(f"{search:>6}: {expanded[search]:>8} nodes expanded {elapsed[search] * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    levels = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    routes = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(levels, routes)
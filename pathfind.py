@@ -1,3 +1,11 @@
+import heapq
+import math
+import os
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from settings import PATHSEARCH
+
+
 class Stack:
     """Basic implementation of a stack data structure (works as a wrapper for a list)"""
     def __init__(self, data: list):
@@ -13,151 +21,981 @@ class Stack:
         return len(self._data)
 
 
-class _Square:
-    """Basic data structure utilised in calculating the optimum route within pathfinder class"""
-    def __init__(self, x, y, target, parent):
-        self._x = x
-        self._y = y
-        self.target = target
-        self.parent = parent
-        self._g_score = self.compute_g_score()
-        self._h_score = self.compute_h_score()
-        self._f_score = self.compute_f_score()
-
-    def is_root(self):
+def calculate_distance(pos1, pos2):
+    return abs(pos1[0]-pos2[0]) + abs(pos1[1]-pos2[1])
+
+
+class PassabilityGrid:
+    """Compact copy of a level layout: a row major bytearray holding 1 for passable tiles and 0 for walls
+    Built once per level so that tiles can be checked with flat index arithmetic"""
+    def __init__(self, map_data):
+        self._width = len(map_data[0])
+        self._height = len(map_data)
+        self._cells = bytearray(char != "#" for row in map_data for char in row)
+        self._labels = self._label_components()
+
+    def _label_components(self):
+        """Labels each passable tile with the number of its connected component (counting from 1)
+        Walls are labelled 0, found via a breadth first flood fill from each unlabelled tile"""
+        cells = self._cells
+        width = self._width
+        labels = [0] * len(cells)
+        label = 0
+        for index in range(len(cells)):
+            if not cells[index] or labels[index]:
+                continue
+            label += 1
+            labels[index] = label
+            frontier = deque([index])
+            while frontier:
+                current = frontier.popleft()
+                x_pos = current % width
+                for adjacent, in_bounds in ((current + 1, x_pos + 1 < width), (current - width, current >= width),
+                                            (current - 1, x_pos > 0), (current + width, current + width < len(cells))):
+                    if in_bounds and cells[adjacent] and not labels[adjacent]:
+                        labels[adjacent] = label
+                        frontier.append(adjacent)
+        return labels
+
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+    def get_cells(self):
+        return self._cells
+
+    def get_index(self, x_pos, y_pos):
+        return y_pos * self._width + x_pos
+
+    def get_pos(self, index):
+        y_pos, x_pos = divmod(index, self._width)
+        return x_pos, y_pos
+
+    def is_passable(self, x_pos, y_pos):
+        if 0 <= x_pos < self._width and 0 <= y_pos < self._height:
+            return self._cells[y_pos * self._width + x_pos] == 1
         return False
 
-    def get_x(self):
-        return self._x
-
-    def get_y(self):
-        return self._y
-
-    def get_f_score(self):
-        return self._f_score
-
-    def get_g_score(self):
-        return self._g_score
-
-    def compute_g_score(self):
-        return self.parent.get_g_score() + 1
-
-    def compute_h_score(self):
-        return self.calculate_distance((self._x,self._y), self.target)
-
-    def compute_f_score(self):
-        return self._g_score + self._h_score
+    def get_component(self, x_pos, y_pos):
+        """Returns the connected component label of a tile, or 0 for walls and tiles outside the grid"""
+        if 0 <= x_pos < self._width and 0 <= y_pos < self._height:
+            return self._labels[y_pos * self._width + x_pos]
+        return 0
 
-    def calculate_distance(self,pos1,pos2):
-        return abs(pos1[0]-pos2[0]) + abs(pos1[1]-pos2[1])
+    def same_component(self, pos1, pos2):
+        """Returns True if a route exists between the two tiles, i.e. both are passable and connected"""
+        label = self.get_component(int(pos1[0]), int(pos1[1]))
+        return label != 0 and label == self.get_component(int(pos2[0]), int(pos2[1]))
 
 
-class _RootSquare(_Square):
-    """Specific route tile: doesn't have a parent tile"""
-    def __init__(self, x, y, target):
-        self._x = x
-        self._y = y
-        self.target = target
-        self._g_score = 0
-        self._h_score = self.calculate_distance((x,y), target)
-        self._f_score = self._h_score
-
-    def is_root(self):
-        return True
+def get_adjacent_tiles(tile, grid):
+    """Returns all tiles that are adjacent N/E/S/W from a given tile and are not walls"""
+    adjacents = []
+    offsets = ((1,0),(0,-1),(-1,0),(0,1))
+    for offset in offsets:
+        x_pos = tile[0] + offset[0]
+        y_pos = tile[1] + offset[1]
+        if grid.is_passable(x_pos, y_pos):
+            adjacents.append((x_pos, y_pos))
+    return adjacents
 
 
 class Pathfinder():
-    def __init__(self, start_pos, end_pos, map_data):
-        self._start_pos = start_pos
-        self._end_pos = end_pos
-        self._map_data = map_data
+    """A* search between two tiles, where search selects how successors of a tile are found:
+    "astar" expands every adjacent tile whereas "jps" only expands jump points (Jump Point Search)
+    A deferred search is only advanced when advance is called, allowing it to be spread over several frames"""
+    def __init__(self, start_pos, end_pos, grid, search=PATHSEARCH, deferred=False):
+        self._grid = grid
+        self._cells = grid.get_cells()
+        self._width = grid.get_width()
+        # Tiles are referred to by their index within the passability grid throughout the search
+        self._end_pos = int(end_pos[0]), int(end_pos[1])
+        self._start_index = grid.get_index(int(start_pos[0]), int(start_pos[1]))
+        self._end_index = grid.get_index(*self._end_pos)
+        if search == "jps":
+            self._get_successors = self._get_jump_points
+        else:
+            self._get_successors = self._get_adjacent_successors
+
+        # Search tables are keyed by tile index: parent tile and best known g score of each reached tile
+        self._parents = {self._start_index: None}
+        self._g_scores = {self._start_index: 0}
+        self._closed_set = set()
+        self._expanded_count = 0
+
+        # valid_path remains None until the search has finished
+        self.valid_path = None
+        # Targets that can't be reached from the start tile are rejected before any search runs
+        if not grid.same_component(start_pos, self._end_pos):
+            self.valid_path = False
+        self._search = self._find_path()
+        if not deferred:
+            self.advance()
+
+    def advance(self, max_nodes=None):
+        """Continues the search for up to max_nodes tile expansions (or until finished if None)
+        Returns True once the search has finished"""
+        if self.valid_path is not None:
+            return True
+        stop_count = None if max_nodes is None else self._expanded_count + max_nodes
+        while stop_count is None or self._expanded_count < stop_count:
+            try:
+                next(self._search)
+            except StopIteration as result:
+                self.valid_path = result.value
+                return True
+        return False
 
-        # Initialise start point for pathfinding
-        self._source_square = _RootSquare(self._start_pos[0], self._start_pos[1], self._end_pos)
-        self._open_list = [self._source_square]
-        self._closed_list = []
+    def is_finished(self):
+        return self.valid_path is not None
 
-        self.valid_path = self._find_path()
+    def _calculate_h_score(self, index):
+        y_pos, x_pos = divmod(index, self._width)
+        return abs(x_pos - self._end_pos[0]) + abs(y_pos - self._end_pos[1])
 
     def _find_path(self):
-        """Implementation of A* pathfinding algorithm"""
+        """Implementation of A* pathfinding algorithm using a binary heap as the open list
+        Yields after every expanded tile so that the search can be paused and resumed"""
+        # Heap entries are (f score, h score, insertion count, tile), ties on f are broken towards the target
+        # And then by insertion order so the search never has to compare tiles
+        h_score = self._calculate_h_score(self._start_index)
+        open_heap = [(h_score, h_score, 0, self._start_index)]
+        count = 1
+
         # Loop runs until a path is found or all possible options exhausted
-        while len(self._open_list) != 0:
-            # Grabs square with lowest f score from the open list and moves to closed list
-            current_square = self._lowestFScore()
-            self._closed_list.append(current_square)
-            self._open_list.remove(current_square)
+        while open_heap:
+            current_tile = heapq.heappop(open_heap)[3]
+            # Tiles can be pushed more than once when a cheaper route is found, stale entries are skipped
+            if current_tile in self._closed_set:
+                continue
+            self._closed_set.add(current_tile)
+            self._expanded_count += 1
 
             # Checks if end point of search has been reached
-            for square in self._closed_list:
-                if square.get_x() == self._end_pos[0] and square.get_y() == self._end_pos[1]:
-                    return True
-
-            # Grabs all squares adjacent to one currently inspected
-            adjacentSquares = self._get_adjacent_squares(current_square)
-            for aSquare in adjacentSquares:
-                # Checks if square has already been inspected
-                if self._check_similar_square(aSquare, self._closed_list):
+            if current_tile == self._end_index:
+                return True
+
+            for successor, distance in self._get_successors(current_tile):
+                if successor in self._closed_set:
                     continue
-                # Adds square to open list if not already within open list
-                if not self._check_similar_square(aSquare, self._open_list):
-                    self._open_list.append(aSquare)
-                # If in open list already checks if more efficient path to this square has been identified
-                # and sets squares 'parent' as appropriate
-                else:
-                    if current_square.get_g_score() < aSquare.get_g_score():
-                        aSquare.parent = current_square
+                # Only records the tile if it is new or a more efficient path to it has been identified
+                g_score = self._g_scores[current_tile] + distance
+                if g_score < self._g_scores.get(successor, g_score + 1):
+                    self._g_scores[successor] = g_score
+                    self._parents[successor] = current_tile
+                    h_score = self._calculate_h_score(successor)
+                    heapq.heappush(open_heap, (g_score + h_score, h_score, count, successor))
+                    count += 1
+            yield
         # Only reached if finding path was impossible and thus unsuccessful
         return False
 
-
-
-    def _check_similar_square(self, aSquare, aList):
-        """Check if square in same position already exists within given list"""
-        pos_x = aSquare.get_x()
-        pos_y = aSquare.get_y()
-        for square in aList:
-            if pos_x == square.get_x() and pos_y == square.get_y():
-                return True
-        return False
-
-    def _get_adjacent_squares(self, current_square):
-        """Returns all squares that are adjacent N/E/S/W from current position"""
-        adjacents = []
-        offsets = ((1,0),(0,-1),(-1,0),(0,1))
-        for offset in offsets:
-            x_pos = int(current_square.get_x()) + offset[0]
-            y_pos = int(current_square.get_y()) + offset[1]
-            tile = self._map_data[y_pos][x_pos]
-            if tile != "#":
-                adjacents.append(_Square(x_pos, y_pos, self._end_pos, current_square))
-        return adjacents
-
-    def _lowestFScore(self):
-        """Returns square in open list with the lowest f score"""
-        lowest_f_score = -1
-        lowest_square = None
-        for square in self._open_list:
-            if (lowest_f_score == -1) or square.get_f_score() < lowest_f_score:
-                lowest_f_score = square.get_f_score()
-                lowest_square = square
-        return lowest_square
+    def _get_adjacent_successors(self, index):
+        """Returns the passable tiles N/E/S/W of a tile, checked via their offsets within the grid"""
+        cells = self._cells
+        width = self._width
+        x_pos = index % width
+        successors = []
+        if x_pos + 1 < width and cells[index + 1]:
+            successors.append((index + 1, 1))
+        if index >= width and cells[index - width]:
+            successors.append((index - width, 1))
+        if x_pos > 0 and cells[index - 1]:
+            successors.append((index - 1, 1))
+        if index + width < len(cells) and cells[index + width]:
+            successors.append((index + width, 1))
+        return successors
+
+    def _get_jump_points(self, index):
+        """Returns the jump points reachable from a tile in the directions left after pruning
+        Directions are pruned based upon the direction the tile was reached from"""
+        x_pos, y_pos = self._grid.get_pos(index)
+        parent = self._parents[index]
+        if parent is None:
+            directions = ((1,0),(0,-1),(-1,0),(0,1))
+        else:
+            # Normalises the direction of travel from the parent jump point
+            parent_x, parent_y = self._grid.get_pos(parent)
+            dx = (x_pos > parent_x) - (x_pos < parent_x)
+            dy = (y_pos > parent_y) - (y_pos < parent_y)
+            if dx != 0:
+                directions = ((0,-1),(0,1),(dx,0))
+            else:
+                directions = ((-1,0),(1,0),(0,dy))
+
+        jump_points = []
+        for direction in directions:
+            if self._grid.is_passable(x_pos + direction[0], y_pos + direction[1]):
+                jump_point = self._jump((x_pos, y_pos), direction)
+                if jump_point is not None:
+                    jump_points.append((self._grid.get_index(*jump_point),
+                                        calculate_distance((x_pos, y_pos), jump_point)))
+        return jump_points
+
+    def _jump(self, tile, direction):
+        """Travels in a straight line from a tile until a wall is hit (returns None) or a tile
+        That has a forced neighbour or is the end point is found (returns the tile)
+        Tiles are read straight from the flat cells array, stepping the index by 1 or by a row"""
+        dx, dy = direction
+        x_pos, y_pos = tile
+        if dx != 0:
+            return self._jump_horizontal(x_pos, y_pos, dx)
+
+        cells = self._cells
+        width = self._width
+        height = len(cells) // width
+        end_index = self._end_index
+        step = dy * width
+        index = y_pos * width + x_pos
+        while True:
+            y_pos += dy
+            index += step
+            if not 0 <= y_pos < height or not cells[index]:
+                return None
+            if index == end_index:
+                return x_pos, y_pos
+            # Vertical travel: forced neighbour to either side where the tile behind it is a wall
+            behind = index - step
+            if (x_pos > 0 and cells[index - 1] and not cells[behind - 1]) or \
+                    (x_pos + 1 < width and cells[index + 1] and not cells[behind + 1]):
+                return x_pos, y_pos
+            # Also has to stop if a horizontal jump from this tile would find a jump point
+            if self._jump_horizontal(x_pos, y_pos, 1) is not None or self._jump_horizontal(x_pos, y_pos, -1) is not None:
+                return x_pos, y_pos
+
+    def _jump_horizontal(self, x_pos, y_pos, dx):
+        """Horizontal part of _jump, also used for the scans made at each step of vertical travel"""
+        cells = self._cells
+        width = self._width
+        end_index = self._end_index
+        index = y_pos * width + x_pos
+        has_above = y_pos > 0
+        has_below = index + width < len(cells)
+        while True:
+            x_pos += dx
+            index += dx
+            if not 0 <= x_pos < width or not cells[index]:
+                return None
+            if index == end_index:
+                return x_pos, y_pos
+            # Horizontal travel: forced neighbour above or below where the tile behind it is a wall
+            if (has_above and cells[index - width] and not cells[index - width - dx]) or \
+                    (has_below and cells[index + width] and not cells[index + width - dx]):
+                return x_pos, y_pos
 
     def is_valid_path(self):
         # Interface to check if a valid path was found
         return self.valid_path
 
+    def get_expanded_count(self):
+        # Interface to check how many tiles the search had to expand
+        return self._expanded_count
+
     def get_shortest_route(self):
         # Interface to allow the shortest route identified to be returned as a stack of squares
         # In order that the enemy should traverse to reach target destination
-        orderedSquareRoute = []
-        square = self._closed_list[-1]
-        while not square.is_root():
-            orderedSquareRoute.append(square)
-            square = square.parent
-
         route = []
-        for square in orderedSquareRoute:
-            route.append((square.get_x(), square.get_y()))
+        if not self.valid_path:
+            return Stack(route)
+        index = self._end_index
+        while self._parents[index] is not None:
+            parent = self._grid.get_pos(self._parents[index])
+            tile = self._grid.get_pos(index)
+            # Consecutive tiles in the search tables may be jump points so the straight line between is filled in
+            dx = (parent[0] > tile[0]) - (parent[0] < tile[0])
+            dy = (parent[1] > tile[1]) - (parent[1] < tile[1])
+            while tile != parent:
+                route.append(tile)
+                tile = tile[0] + dx, tile[1] + dy
+            index = self._parents[index]
 
         return Stack(route)
+
+
+class IncrementalPlanner:
+    """Moving Target D* Lite: a search from the enemy's tile towards its target tile that is kept between requests
+    When the target moves only the heuristic changes, which is absorbed by a key modifier as in D* Lite.
+    When the enemy moves along its route the search tree is re-rooted at its new tile, keeping the tiles beneath it
+    And deleting the rest, so only the part of the tree that changed is searched again.
+    Routes are always shortest routes"""
+    def __init__(self, grid):
+        self._grid = grid
+        self._cells = grid.get_cells()
+        self._width = grid.get_width()
+        # Tiles are referred to by their index within the passability grid, the root being the enemy's tile
+        self._root = None
+        self._goal = None
+        self._key_modifier = 0
+        # Scores of tiles missing from these tables are infinite, parents point one step closer to the root
+        self._g_scores = {}
+        self._rhs_scores = {}
+        self._parents = {}
+        # Heap entries are (key, tile), entries whose key no longer matches _open_keys are stale and skipped
+        self._open_heap = []
+        self._open_keys = {}
+        self._expanded_count = 0
+
+    def find_route(self, start_pos, end_pos):
+        """Returns a stack of tiles from start to end position or None if unreachable
+        The kept search is updated for the new positions rather than searching from scratch"""
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+        if not self._grid.same_component(start_pos, end_pos):
+            return None
+        root = self._grid.get_index(*start_pos)
+        goal = self._grid.get_index(*end_pos)
+
+        if root != self._root and root not in self._rhs_scores:
+            self._reset(root, goal)
+        else:
+            if goal != self._goal:
+                self._move_goal(goal)
+            if root != self._root:
+                self._move_root(root)
+
+        self._compute_route()
+        return Stack(self._get_route())
+
+    def _reset(self, root, goal):
+        """Discards the kept search and starts a new one from the root"""
+        self._root = root
+        self._goal = goal
+        self._key_modifier = 0
+        self._g_scores = {}
+        self._rhs_scores = {root: 0}
+        self._parents = {root: None}
+        self._open_heap = []
+        self._open_keys = {}
+        self._update_state(root)
+
+    def _move_goal(self, goal):
+        # Keys already in the open list were calculated with the old heuristic, they remain lower bounds
+        # Once the distance the heuristic's target has moved is added to every new key
+        self._key_modifier += self._calculate_distance(self._goal, goal)
+        self._goal = goal
+
+    def _move_root(self, root):
+        """Re-roots the search tree at a tile within it, deleting the tiles whose parents don't lead through it
+        Scores are distances from the first root, so as the kept tiles are all beneath the new root their scores
+        Stay consistent with it without changing them (only the difference between scores matters)"""
+        parents = self._parents
+        deleted = []
+        frontier = [self._root]
+        parents[root] = None
+        self._root = root
+        # Walks down the tree from the old root, a tile's children being the adjacent tiles it is the parent of
+        while frontier:
+            index = frontier.pop()
+            deleted.append(index)
+            for adjacent in self._get_adjacent_tiles(index):
+                if parents.get(adjacent) == index:
+                    frontier.append(adjacent)
+
+        for index in deleted:
+            self._g_scores.pop(index, None)
+            self._rhs_scores.pop(index, None)
+            parents.pop(index, None)
+            self._open_keys.pop(index, None)
+        # Deleted tiles next to the kept subtree get scores from it again
+        for index in deleted:
+            self._recalculate_rhs(index)
+            self._update_state(index)
+
+    def _calculate_distance(self, index1, index2):
+        y_pos1, x_pos1 = divmod(index1, self._width)
+        y_pos2, x_pos2 = divmod(index2, self._width)
+        return abs(x_pos1 - x_pos2) + abs(y_pos1 - y_pos2)
+
+    def _calculate_key(self, index):
+        score = min(self._g_scores.get(index, math.inf), self._rhs_scores.get(index, math.inf))
+        return score + self._calculate_distance(index, self._goal) + self._key_modifier, score
+
+    def _update_state(self, index):
+        """Keeps the open list holding exactly the tiles whose g and rhs scores differ"""
+        if self._g_scores.get(index, math.inf) != self._rhs_scores.get(index, math.inf):
+            key = self._calculate_key(index)
+            self._open_keys[index] = key
+            heapq.heappush(self._open_heap, (key, index))
+        else:
+            self._open_keys.pop(index, None)
+
+    def _recalculate_rhs(self, index):
+        """Sets the rhs score of a tile to one more than its best adjacent g score, with that tile as parent"""
+        best_score = math.inf
+        best_parent = None
+        for adjacent in self._get_adjacent_tiles(index):
+            score = self._g_scores.get(adjacent, math.inf) + 1
+            if score < best_score:
+                best_score = score
+                best_parent = adjacent
+        if best_parent is None:
+            self._rhs_scores.pop(index, None)
+            self._parents.pop(index, None)
+        else:
+            self._rhs_scores[index] = best_score
+            self._parents[index] = best_parent
+
+    def _get_adjacent_tiles(self, index):
+        cells = self._cells
+        width = self._width
+        x_pos = index % width
+        adjacents = []
+        if x_pos + 1 < width and cells[index + 1]:
+            adjacents.append(index + 1)
+        if index >= width and cells[index - width]:
+            adjacents.append(index - width)
+        if x_pos > 0 and cells[index - 1]:
+            adjacents.append(index - 1)
+        if index + width < len(cells) and cells[index + width]:
+            adjacents.append(index + width)
+        return adjacents
+
+    def _compute_route(self):
+        """Processes inconsistent tiles in key order until the goal's score is known to be its shortest distance"""
+        open_heap = self._open_heap
+        open_keys = self._open_keys
+        g_scores = self._g_scores
+        rhs_scores = self._rhs_scores
+        parents = self._parents
+        root = self._root
+        goal = self._goal
+        goal_y, goal_x = divmod(goal, self._width)
+        width = self._width
+        key_modifier = self._key_modifier
+        inf = math.inf
+        while open_heap:
+            key, index = open_heap[0]
+            if open_keys.get(index) != key:
+                heapq.heappop(open_heap)
+                continue
+            goal_g_score = g_scores.get(goal, inf)
+            goal_rhs_score = rhs_scores.get(goal, inf)
+            if goal_g_score == goal_rhs_score and key >= (goal_g_score + key_modifier, goal_g_score):
+                break
+
+            heapq.heappop(open_heap)
+            g_score = g_scores.get(index, inf)
+            rhs_score = rhs_scores.get(index, inf)
+            score = min(g_score, rhs_score)
+            y_pos, x_pos = divmod(index, width)
+            new_key = score + abs(x_pos - goal_x) + abs(y_pos - goal_y) + key_modifier, score
+            if key < new_key:
+                open_keys[index] = new_key
+                heapq.heappush(open_heap, (new_key, index))
+                continue
+
+            self._expanded_count += 1
+            del open_keys[index]
+            if g_score > rhs_score:
+                # Tile's distance has dropped, so adjacent tiles may now be reached more cheaply through it
+                g_scores[index] = rhs_score
+                for adjacent in self._get_adjacent_tiles(index):
+                    if adjacent != root and rhs_scores.get(adjacent, inf) > rhs_score + 1:
+                        rhs_scores[adjacent] = rhs_score + 1
+                        parents[adjacent] = index
+                        self._update_state(adjacent)
+            else:
+                # Tile's distance has risen, so tiles that were reached through it need new parents
+                del g_scores[index]
+                for adjacent in self._get_adjacent_tiles(index):
+                    if adjacent != root and parents.get(adjacent) == index:
+                        self._recalculate_rhs(adjacent)
+                        self._update_state(adjacent)
+                self._update_state(index)
+
+    def _get_route(self):
+        """Returns the tiles from the goal back to the root (excluding the root), as stored in a Stack
+        Each step moves to the adjacent tile with the lowest g score"""
+        route = []
+        index = self._goal
+        while index != self._root:
+            route.append(self._grid.get_pos(index))
+            index = min(self._get_adjacent_tiles(index), key=lambda adjacent: self._g_scores.get(adjacent, math.inf))
+        return route
+
+    def get_expanded_count(self):
+        # Total tiles expanded over all requests, for comparison against searching from scratch each time
+        return self._expanded_count
+
+
+class FlowField:
+    """Distance field towards a single target tile (the player) that is shared by every enemy
+    Each reachable tile stores the adjacent tile that is one step closer to the target, held in flat
+    Row major lists indexed like the passability grid (-1 marking tiles the target can't be reached from)"""
+    def __init__(self, grid):
+        self._grid = grid
+        self._target = None
+        self._distances = []
+        self._next_steps = []
+
+    def update(self, target):
+        """Rebuilds the field via a breadth first search from the target, only if the target tile has changed
+        Called by enemies when they need a route, so the field isn't rebuilt while no enemy is using it.
+        Returns True if the field was rebuilt"""
+        target = int(target[0]), int(target[1])
+        if target == self._target:
+            return False
+        self._target = target
+
+        cells = self._grid.get_cells()
+        width = self._grid.get_width()
+        self._distances = distances = [-1] * len(cells)
+        self._next_steps = next_steps = [-1] * len(cells)
+        if not self._grid.is_passable(*target):
+            return True
+
+        target_index = self._grid.get_index(*target)
+        distances[target_index] = 0
+        queue = deque([target_index])
+        while queue:
+            current = queue.popleft()
+            distance = distances[current] + 1
+            x_pos = current % width
+            for adjacent, in_bounds in ((current + 1, x_pos + 1 < width), (current - width, current >= width),
+                                        (current - 1, x_pos > 0), (current + width, current + width < len(cells))):
+                if in_bounds and cells[adjacent] and distances[adjacent] < 0:
+                    distances[adjacent] = distance
+                    next_steps[adjacent] = current
+                    queue.append(adjacent)
+        return True
+
+    def get_target(self):
+        return self._target
+
+    def _get_index(self, tile):
+        x_pos, y_pos = int(tile[0]), int(tile[1])
+        if self._distances and 0 <= x_pos < self._grid.get_width() and 0 <= y_pos < self._grid.get_height():
+            return self._grid.get_index(x_pos, y_pos)
+        return None
+
+    def get_distance(self, tile):
+        # Returns None if the target can't be reached from the given tile
+        index = self._get_index(tile)
+        if index is None or self._distances[index] < 0:
+            return None
+        return self._distances[index]
+
+    def get_next_step(self, tile):
+        # Returns None if tile is the target or the target can't be reached from the given tile
+        index = self._get_index(tile)
+        if index is None or self._next_steps[index] < 0:
+            return None
+        return self._grid.get_pos(self._next_steps[index])
+
+
+# Grid of the current level within a worker process of BatchPathSolver, set once when the worker starts
+_worker_grid = None
+
+
+def _init_worker(grid):
+    global _worker_grid
+    _worker_grid = grid
+
+
+def solve_batch(requests, grid=None):
+    """Finds the route for every (start pos, end pos) pair in requests, returning a tuple of tiles
+    (end tile first, as stored in a Stack) or None for each pair. Within a worker the worker's grid is used"""
+    if grid is None:
+        grid = _worker_grid
+    routes = []
+    for start_pos, end_pos in requests:
+        router = Pathfinder(start_pos, end_pos, grid)
+        if router.is_valid_path():
+            routes.append(tuple(router.get_shortest_route()._data))
+        else:
+            routes.append(None)
+    return routes
+
+
+class RouteCache:
+    """Bounded store of finished routes keyed by (start tile, end tile), least recently used routes are evicted first
+    As the map is undirected a cached route can also be reversed to answer the opposite request"""
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._routes = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get_route(self, start_pos, end_pos, grid):
+        """Returns a stack of tiles leading from start to end position (None if unreachable)
+        Only searches for a route if neither it nor its reverse has been cached"""
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+
+        key = start_pos, end_pos
+        if key in self._routes:
+            self._hits += 1
+            self._routes.move_to_end(key)
+            route = self._routes[key]
+        elif (end_pos, start_pos) in self._routes:
+            self._hits += 1
+            self._routes.move_to_end((end_pos, start_pos))
+            reverse_route = self._routes[(end_pos, start_pos)]
+            route = None
+            if reverse_route is not None:
+                # Routes are stored end tile first and exclude their start tile, so the reversed route
+                # Gains the end position and loses the position it was requested from
+                route = (end_pos, *reversed(reverse_route[1:]))
+        else:
+            router = Pathfinder(start_pos, end_pos, grid)
+            route = None
+            if router.is_valid_path():
+                route = router.get_shortest_route()
+            self.store_route(start_pos, end_pos, route)
+            return route
+
+        if route is None:
+            return None
+        return Stack(list(route))
+
+    def has_route(self, start_pos, end_pos):
+        """Checks if a route (or its reverse) between the two positions is cached, without counting as a hit"""
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+        return (start_pos, end_pos) in self._routes or (end_pos, start_pos) in self._routes
+
+    def store_route(self, start_pos, end_pos, route):
+        """Caches a route (a stack of tiles, or None if unreachable) that had to be searched for
+        As such every stored route counts as a miss"""
+        self._misses += 1
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+        if route is not None:
+            route = tuple(route._data)
+        self._routes[(start_pos, end_pos)] = route
+        self._routes.move_to_end((start_pos, end_pos))
+        if len(self._routes) > self._max_size:
+            self._routes.popitem(last=False)
+
+    def clear(self):
+        self._routes.clear()
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def get_size(self):
+        return len(self._routes)
+
+
+class ReservationTable:
+    """Records which tile each enemy is heading to so that no two enemies target the same tile
+    Tiles are mapped to their owner, with a reverse index from owner to tile so claims and releases are O(1)"""
+    def __init__(self):
+        self._owners = {}
+        self._tiles = {}
+
+    def claim(self, owner, tile):
+        """Reserves a tile for an owner, releasing the tile it previously held
+        Returns False without changing anything if the tile is reserved by another owner"""
+        tile = int(tile[0]), int(tile[1])
+        if self._owners.get(tile, owner) is not owner:
+            return False
+        self.release(owner)
+        self._owners[tile] = owner
+        self._tiles[owner] = tile
+        return True
+
+    def release(self, owner):
+        tile = self._tiles.pop(owner, None)
+        if tile is not None:
+            del self._owners[tile]
+
+    def is_free(self, tile, owner=None):
+        """Returns True if the tile isn't reserved, or is reserved by the given owner"""
+        return self._owners.get((int(tile[0]), int(tile[1])), owner) is owner
+
+    def get_owner(self, tile):
+        return self._owners.get((int(tile[0]), int(tile[1])))
+
+    def get_tile(self, owner):
+        return self._tiles.get(owner)
+
+    def get_free_tiles(self, centre, radius, owner=None):
+        """Returns the tiles within radius of centre (as a square) that are free for the owner
+        Ordered ring by ring outwards from the centre, and row by row within each ring"""
+        centre_x, centre_y = int(centre[0]), int(centre[1])
+        free_tiles = []
+        for ring in range(radius + 1):
+            for y_pos in range(centre_y - ring, centre_y + ring + 1):
+                # Only the first and last rows of a ring are full, other rows hold just the two end tiles
+                x_step = 1 if abs(y_pos - centre_y) == ring else max(2 * ring, 1)
+                for x_pos in range(centre_x - ring, centre_x + ring + 1, x_step):
+                    if self._owners.get((x_pos, y_pos), owner) is owner:
+                        free_tiles.append((x_pos, y_pos))
+        return free_tiles
+
+    def clear(self):
+        self._owners.clear()
+        self._tiles.clear()
+
+
+class HierarchicalPlanner:
+    """Two level planner: routes are first planned over the graph of rooms and corridors
+    Using the door tiles between them, and then only the first segment is refined tile by tile"""
+    def __init__(self, grid, regions):
+        self._grid = grid
+        self._regions = regions
+
+        # Maps every floor tile enclosed by a room or corridor to the index of that region
+        # Regions earlier in the list take priority, mirroring Map.get_room_or_corridor
+        self._tile_regions = {}
+        for index, region in enumerate(regions):
+            for x_pos in range(region.get_x() + 1, region.get_end_x()):
+                for y_pos in range(region.get_y() + 1, region.get_end_y()):
+                    if grid.is_passable(x_pos, y_pos) and (x_pos, y_pos) not in self._tile_regions:
+                        self._tile_regions[(x_pos, y_pos)] = index
+
+        # Door tiles are tiles adjacent to a tile of another region, linked to those tiles
+        self._door_links = {}
+        self._region_doors = [[] for region in regions]
+        for tile, index in self._tile_regions.items():
+            for adjacent_tile in get_adjacent_tiles(tile, grid):
+                adjacent_index = self._tile_regions.get(adjacent_tile)
+                if adjacent_index is not None and adjacent_index != index:
+                    if tile not in self._door_links:
+                        self._door_links[tile] = []
+                        self._region_doors[index].append(tile)
+                    self._door_links[tile].append(adjacent_tile)
+
+        # Distances between every pair of doors belonging to the same region
+        self._door_distances = {}
+        for index, doors in enumerate(self._region_doors):
+            for door in doors:
+                distances = self._region_distances(door, index)
+                self._door_distances[door] = [(other, distances[other]) for other in doors
+                                              if other != door and other in distances]
+
+    def _region_distances(self, source, index):
+        """Breadth first search from a tile that is limited to the tiles of a single region"""
+        distances = {source: 0}
+        queue = deque([source])
+        while queue:
+            current_tile = queue.popleft()
+            distance = distances[current_tile] + 1
+            for adjacent_tile in get_adjacent_tiles(current_tile, self._grid):
+                if adjacent_tile not in distances and self._tile_regions.get(adjacent_tile) == index:
+                    distances[adjacent_tile] = distance
+                    queue.append(adjacent_tile)
+        return distances
+
+    def get_region_index(self, tile):
+        return self._tile_regions.get((int(tile[0]), int(tile[1])))
+
+    def find_route(self, start_pos, end_pos):
+        """Returns a stack of tiles leading from the start towards the end position, or None if unreachable
+        If both positions are in different regions only the route to the first tile of the next region is given"""
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+        start_index = self._tile_regions.get(start_pos)
+        end_index = self._tile_regions.get(end_pos)
+
+        # Positions within the same region (or outside of any region) are searched for directly
+        if start_index is None or end_index is None or start_index == end_index:
+            router = Pathfinder(start_pos, end_pos, self._grid)
+            if router.is_valid_path():
+                return router.get_shortest_route()
+            return None
+
+        # Connects the start and end positions to the doors of their regions
+        start_distances = self._region_distances(start_pos, start_index)
+        end_distances = self._region_distances(end_pos, end_index)
+
+        # Dijkstra's algorithm over the door graph, where the end position is reached through the doors of its region
+        costs = {}
+        parents = {}
+        open_heap = []
+        count = 0
+        for door in self._region_doors[start_index]:
+            if door in start_distances:
+                costs[door] = start_distances[door]
+                parents[door] = None
+                heapq.heappush(open_heap, (costs[door], count, door))
+                count += 1
+
+        first_door = None
+        closed_set = set()
+        while open_heap:
+            cost, _, door = heapq.heappop(open_heap)
+            if door == end_pos:
+                first_door = door
+                break
+            if door in closed_set:
+                continue
+            closed_set.add(door)
+
+            neighbours = [(linked, 1) for linked in self._door_links[door]]
+            neighbours.extend(self._door_distances[door])
+            if self._tile_regions[door] == end_index and door in end_distances:
+                neighbours.append((end_pos, end_distances[door]))
+            for neighbour, distance in neighbours:
+                if cost + distance < costs.get(neighbour, cost + distance + 1):
+                    costs[neighbour] = cost + distance
+                    parents[neighbour] = door
+                    heapq.heappush(open_heap, (cost + distance, count, neighbour))
+                    count += 1
+
+        if first_door is None:
+            return None
+
+        # Walks back along the door route to find the first tile outside of the start region
+        while parents[first_door] is not None and self._tile_regions[parents[first_door]] != start_index:
+            first_door = parents[first_door]
+
+        # Only the first segment is refined to a tile level route
+        router = Pathfinder(start_pos, first_door, self._grid)
+        return router.get_shortest_route()
+
+
+class PathScheduler:
+    """Queue of path requests that are searched for a limited number of tile expansions per frame
+    Requests are served in order of priority (lowest first) and results are handed back via receive_route"""
+    def __init__(self, grid, route_cache, node_budget):
+        self._grid = grid
+        self._route_cache = route_cache
+        self._node_budget = node_budget
+
+        # Heap entries are (priority, insertion count, owner, start pos, end pos, router)
+        self._requests = []
+        self._pending = {}
+        self._count = 0
+
+    def submit(self, owner, start_pos, end_pos, priority):
+        """Queues a request, replacing any request the owner already has pending"""
+        router = None
+        # Requests already answered by the route cache are handed back without searching
+        if not self._route_cache.has_route(start_pos, end_pos):
+            router = Pathfinder(start_pos, end_pos, self._grid, deferred=True)
+            priority = (1, priority)
+        else:
+            priority = (0, priority)
+        request = (priority, self._count, owner, start_pos, end_pos, router)
+        self._pending[owner] = request
+        heapq.heappush(self._requests, request)
+        self._count += 1
+
+    def cancel(self, owner):
+        self._pending.pop(owner, None)
+
+    def is_pending(self, owner):
+        return owner in self._pending
+
+    def update(self):
+        """Advances queued searches until the node budget for this frame is used up
+        Requests submitted during the update (such as from receive_route) are left until the next update"""
+        budget = self._node_budget
+        submitted_count = self._count
+        while self._requests and budget > 0:
+            request = self._requests[0]
+            priority, count, owner, start_pos, end_pos, router = request
+            # Requests that were cancelled or replaced are discarded
+            if self._pending.get(owner) is not request:
+                heapq.heappop(self._requests)
+                continue
+            if count >= submitted_count:
+                break
+
+            if router is None:
+                # Answers from the route cache are charged as a single node so each update is bounded
+                route = self._route_cache.get_route(start_pos, end_pos, self._grid)
+                budget -= 1
+            else:
+                expanded_count = router.get_expanded_count()
+                finished = router.advance(budget)
+                budget -= router.get_expanded_count() - expanded_count
+                if not finished:
+                    break
+                route = None
+                if router.is_valid_path():
+                    route = router.get_shortest_route()
+                self._route_cache.store_route(start_pos, end_pos, route)
+
+            heapq.heappop(self._requests)
+            del self._pending[owner]
+            owner.receive_route(route)
+
+    def shutdown(self):
+        """Drops all queued requests"""
+        self._requests = []
+        self._pending = {}
+
+
+class BatchPathSolver:
+    """Solves path requests in a pool of worker processes, with the same interface as PathScheduler
+    The level's grid is sent to each worker once when it starts rather than with every request,
+    requests submitted during a frame are sent as one batch split between the workers"""
+    def __init__(self, grid, route_cache, max_workers=None):
+        self._route_cache = route_cache
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(self._max_workers, initializer=_init_worker, initargs=(grid,))
+
+        self._queued = []
+        self._batches = []
+        self._pending = {}
+
+    def submit(self, owner, start_pos, end_pos, priority=None):
+        """Queues a request until the next update, replacing any request the owner already has pending
+        Priority is accepted for compatibility with PathScheduler but all requests of a frame are sent together"""
+        request = (owner, (int(start_pos[0]), int(start_pos[1])), (int(end_pos[0]), int(end_pos[1])))
+        self._pending[owner] = request
+        self._queued.append(request)
+
+    def cancel(self, owner):
+        self._pending.pop(owner, None)
+
+    def is_pending(self, owner):
+        return owner in self._pending
+
+    def update(self):
+        """Hands back the results of finished batches and sends the requests queued since the last update"""
+        unfinished_batches = []
+        for future, batch in self._batches:
+            if not future.done():
+                unfinished_batches.append((future, batch))
+                continue
+            for request, route in zip(batch, future.result()):
+                owner, start_pos, end_pos = request
+                if route is not None:
+                    route = Stack(list(route))
+                self._route_cache.store_route(start_pos, end_pos, route)
+                self._deliver(request, route)
+        self._batches = unfinished_batches
+
+        # Requests already answered by the route cache are handed back without being sent
+        # Requests submitted while results are handed back are left queued until the next update
+        to_solve = []
+        queued = self._queued
+        self._queued = []
+        for request in queued:
+            owner, start_pos, end_pos = request
+            if self._pending.get(owner) is not request:
+                continue
+            if self._route_cache.has_route(start_pos, end_pos):
+                self._deliver(request, self._route_cache.get_route(start_pos, end_pos, None))
+            else:
+                to_solve.append(request)
+
+        # Splits the batch evenly between workers
+        batch_size = -(-len(to_solve) // self._max_workers)
+        for index in range(0, len(to_solve), batch_size or 1):
+            batch = to_solve[index:index + batch_size]
+            pairs = [(start_pos, end_pos) for owner, start_pos, end_pos in batch]
+            self._batches.append((self._executor.submit(solve_batch, pairs), batch))
+
+    def _deliver(self, request, route):
+        # Results of cancelled or replaced requests are discarded
+        owner = request[0]
+        if self._pending.get(owner) is request:
+            del self._pending[owner]
+            owner.receive_route(route)
+
+    def shutdown(self):
+        """Stops the worker processes and drops all queued requests, waiting only for batches already running"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._queued = []
+        self._batches = []
+        self._pending = {}
@@ -1,96 +1,100 @@
 import pygame as pg
 import pygame.gfxdraw
 import math
+from bisect import bisect_right
+from collections import OrderedDict
 from random import choice
 from settings import *
 
+# NumPy is optional, without it intersects are always found via the scalar method
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class Ray:
-    """Ray class that is used within the ray-source object"""
+    """Ray class that is used within the ray-source object
+    Held as plain floats in slots so rays can be updated every frame without allocating any vectors"""
+    __slots__ = ("start_x", "start_y", "end_x", "end_y", "dir_x", "dir_y", "mag", "bearing")
+
     def __init__(self, x1, y1, x2, y2):
-        self._start_pos = pg.Vector2(x1, y1)
-        self._end_pos = pg.Vector2(x2, y2)
-        self._dir = self._end_pos - self._start_pos
-        self._mag = 1
-        self._bearing = self.calculate_bearing()
+        self.reset(x1, y1, x2, y2)
+
+    def reset(self, x1, y1, x2, y2):
+        """Moves ray to new start and end positions, allowing ray objects to be reused"""
+        self.start_x = x1
+        self.start_y = y1
+        self.end_x = x2
+        self.end_y = y2
+        self.dir_x = x2 - x1
+        self.dir_y = y2 - y1
+        self.mag = 1
+        self.bearing = self.calculate_bearing()
 
     def set_magnitude(self, new_mag):
-        self._mag = new_mag
-        self._end_pos = (self._dir * self._mag) + self._start_pos
-        self._dir = self._end_pos - self._start_pos
+        self.mag = new_mag
+        self.end_x = self.dir_x * new_mag + self.start_x
+        self.end_y = self.dir_y * new_mag + self.start_y
+        self.dir_x = self.end_x - self.start_x
+        self.dir_y = self.end_y - self.start_y
 
     def calculate_bearing(self):
-        y_change = self._dir.y
-        x_change = self._dir.x
-        # Abstract cases
-        if x_change == 0:
-            if y_change < 0:
-                return 0
-            else:
-                return math.pi
-        elif y_change == 0:
-            if x_change > 0:
-                return math.pi / 2
-            else:
-                return math.pi * 3 / 2
-        # Standard cases
-        if y_change < 0 and x_change > 0:
-            # TOP-RIGHT QUAD RAY DIR
-            return math.atan(abs(x_change) / abs(y_change))
-        elif y_change > 0 and x_change > 0:
-            # BOTTOM-RIGHT QUAD
-            return math.atan(abs(y_change) / abs(x_change)) + (math.pi / 2)
-        elif y_change > 0 and x_change < 0:
-            # BOTTOM-LEFT QUAD
-            return math.atan(abs(x_change) / abs(y_change)) + math.pi
-        else:
-            # BOTTOM-RIGHT QUAD
-            return math.atan(abs(y_change) / abs(x_change)) + (math.pi * 3 / 2)
+        """Returns bearing of ray clockwise from straight up (negative y), between 0 and 2 pi"""
+        bearing = math.atan2(self.dir_x, -self.dir_y)
+        if bearing < 0:
+            bearing += 2 * math.pi
+        return bearing
 
     def get_direction(self):
-        return self._dir
+        return self.dir_x, self.dir_y
 
     def get_bearing(self):
-        return self._bearing
+        return self.bearing
 
     def get_start_pos(self):
-        return self._start_pos
+        return self.start_x, self.start_y
 
     def get_end_pos(self):
-        return self._end_pos
+        return self.end_x, self.end_y
 
     def get_distance(self):
-        return self._dir.length()
+        return math.hypot(self.dir_x, self.dir_y)
 
 
 class Edge:
-    """Edge class that is used within the ray-source object"""
+    """Edge class that is used within the ray-source object, held as plain floats in slots"""
+    __slots__ = ("start_x", "start_y", "end_x", "end_y", "dir_x", "dir_y")
+
     def __init__(self, x1, y1, x2, y2):
-        self._start_pos = pg.Vector2(x1, y1)
-        self._end_pos = pg.Vector2(x2, y2)
-        self._dir = self._end_pos - self._start_pos
+        self.start_x = x1
+        self.start_y = y1
+        self.end_x = x2
+        self.end_y = y2
+        self.dir_x = x2 - x1
+        self.dir_y = y2 - y1
 
     def get_direction(self):
-        return self._dir
+        return self.dir_x, self.dir_y
 
     def get_start_pos(self):
-        return self._start_pos
+        return self.start_x, self.start_y
 
     def get_end_pos(self):
-        return self._end_pos
+        return self.end_x, self.end_y
 
 
 def _find_intersect(ray, edge):
     """Function that allows for the intersection to be found between a ray and an edge"""
-    r_px = ray.get_start_pos().x
-    r_py = ray.get_start_pos().y
-    r_dx = ray.get_direction().x
-    r_dy = ray.get_direction().y
+    r_px = ray.start_x
+    r_py = ray.start_y
+    r_dx = ray.dir_x
+    r_dy = ray.dir_y
 
-    e_px = edge.get_start_pos().x
-    e_py = edge.get_start_pos().y
-    e_dx = edge.get_direction().x
-    e_dy = edge.get_direction().y
+    e_px = edge.start_x
+    e_py = edge.start_y
+    e_dx = edge.dir_x
+    e_dy = edge.dir_y
 
     if r_dx == 0 or r_dy == 0:
         return None
@@ -107,92 +111,177 @@ def _find_intersect(ray, edge):
         return None
 
 
-def _calculate_triangle_area(p1, p2, p3):
-    return abs((p1[0] * (p2[1] - p3[1]) + p2[0] * (p3[1] - p1[1]) + p3[0] * (p1[1] - p2[1])) / 2)
+def _find_closest_intersects(rays, edges):
+    """Vectorised version of _find_intersect that tests every ray against every edge at once
+    Takes arrays of (start x, start y, direction x, direction y) rows and returns the smallest magnitude
+    At intersect for each ray, or infinity for rays that intersect no edge"""
+    r_px, r_py, r_dx, r_dy = (column[:, None] for column in rays.T)
+    e_px, e_py, e_dx, e_dy = (column[None, :] for column in edges.T)
+
+    # Divisions by zero are masked out below so their warnings are suppressed
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t2 = (r_dx * (e_py - r_py) + r_dy * (r_px - e_px)) / (e_dx * r_dy - e_dy * r_dx)
+        t1 = (e_px + e_dx * t2 - r_px) / r_dx
+    valid = (r_dx != 0) & (r_dy != 0) & (t2 >= 0) & (t2 <= 1) & (t1 > 0) & (t1 < 1)
+    return np.where(valid, t1, np.inf).min(axis=1)
+
+
+class EdgeGrid:
+    """Uniform grid of square cells that each hold the edges passing through them
+    A ray walks the cells along its length in order (DDA) so only edges in those cells are tested"""
+    def __init__(self, edges, cell_size):
+        self._cell_size = cell_size
+        self._cells = {}
+        self._bounds = None
+        for edge in edges:
+            # Edge bounds are widened slightly so edges lying on a cell border are held by the cells on both sides
+            min_x = math.floor((min(edge.start_x, edge.end_x) - 0.001) / cell_size)
+            max_x = math.floor((max(edge.start_x, edge.end_x) + 0.001) / cell_size)
+            min_y = math.floor((min(edge.start_y, edge.end_y) - 0.001) / cell_size)
+            max_y = math.floor((max(edge.start_y, edge.end_y) + 0.001) / cell_size)
+            for cell_x in range(min_x, max_x + 1):
+                for cell_y in range(min_y, max_y + 1):
+                    self._cells.setdefault((cell_x, cell_y), []).append(edge)
+
+            if self._bounds is None:
+                self._bounds = [min_x, min_y, max_x, max_y]
+            else:
+                self._bounds = [min(self._bounds[0], min_x), min(self._bounds[1], min_y),
+                                max(self._bounds[2], max_x), max(self._bounds[3], max_y)]
+
+    def find_closest_intersect(self, ray):
+        """Returns the smallest magnitude at which the ray intersects an edge, or None if it intersects none
+        Cells are visited in order along the ray so the walk stops at the first cell containing an intersect"""
+        start_x = ray.start_x
+        start_y = ray.start_y
+        dir_x = ray.dir_x
+        dir_y = ray.dir_y
+        # Matches _find_intersect, which never finds intersects for horizontal or vertical rays
+        if self._bounds is None or dir_x == 0 or dir_y == 0:
+            return None
+        cell_size = self._cell_size
+        min_x, min_y, max_x, max_y = self._bounds
+
+        # Clips ray to the area covered by the grid
+        t_enter = 0
+        t_leave = 1
+        for pos, change, low, high in ((start_x, dir_x, min_x, max_x), (start_y, dir_y, min_y, max_y)):
+            t_low = (low * cell_size - pos) / change
+            t_high = ((high + 1) * cell_size - pos) / change
+            t_enter = max(t_enter, min(t_low, t_high))
+            t_leave = min(t_leave, max(t_low, t_high))
+        if t_enter > t_leave:
+            return None
+
+        cell_x = min(max(math.floor((start_x + dir_x * t_enter) / cell_size), min_x), max_x)
+        cell_y = min(max(math.floor((start_y + dir_y * t_enter) / cell_size), min_y), max_y)
+        step_x = 1 if dir_x > 0 else -1
+        step_y = 1 if dir_y > 0 else -1
+        # Magnitudes at which the ray crosses the next vertical and horizontal cell borders
+        next_x = ((cell_x + (step_x > 0)) * cell_size - start_x) / dir_x
+        next_y = ((cell_y + (step_y > 0)) * cell_size - start_y) / dir_y
+        delta_x = cell_size / abs(dir_x)
+        delta_y = cell_size / abs(dir_y)
+
+        closest_t1 = None
+        while min_x <= cell_x <= max_x and min_y <= cell_y <= max_y:
+            for edge in self._cells.get((cell_x, cell_y), ()):
+                t1 = _find_intersect(ray, edge)
+                if t1 is not None and (closest_t1 is None or t1 < closest_t1):
+                    closest_t1 = t1
+
+            # Intersects in later cells can't be closer than one found before the ray leaves this cell
+            t_exit = min(next_x, next_y)
+            if (closest_t1 is not None and closest_t1 <= t_exit) or t_exit >= t_leave:
+                break
+            if next_x < next_y:
+                cell_x += step_x
+                next_x += delta_x
+            else:
+                cell_y += step_y
+                next_y += delta_y
+        return closest_t1
+
+
+# Width and height in pixels of each cell of the edge grid
+EDGECELLSIZE = TILESIZE * 4
+
+# Rotation applied to either side of the central ray cast to each corner
+OFFSETANGLE = 0.01
+_OFFSET_COS = math.cos(OFFSETANGLE)
+_OFFSET_SIN = math.sin(OFFSETANGLE)
 
 
 class RaySource:
     """Main class used to provide 'visibility' system within game via the use of 'Ray' and 'Edge' objects"""
-    def __init__(self, pos, corners, edges):
+    def __init__(self, pos, corners, edges, intersect_mode=RAYINTERSECT):
         self._pos = pos
         self._corners = corners
         self._edges = edges
+        self._intersect_mode = intersect_mode
+        # Rays are kept between updates and reset in place rather than being created every frame
+        self._ray_pool = []
 
-        self._update_rays()
+        # Each set of corners and edges seen recently keeps its own version, edge grid and edge array
+        # So returning to a set (such as the room the player just left) reuses its packed edges and cached rays
+        self._occluder_sets = OrderedDict()
+        self._occluder_set_count = 0
+        self._select_occluder_set(corners, edges, None)
 
-    def _update_rays(self):
-        self._rays = []
-        for corner in self._corners:
-            # Casts 3 rays to each corner: A central ray and an offset ray to either side by 0.01 rads
-            ray_central = Ray(self._pos.x, self._pos.y, corner[0], corner[1])
-            ray_offset1 = self._gen_offset_ray(ray_central, 0.01)
-            ray_offset2 = self._gen_offset_ray(ray_central, -0.01)
-            ray_offset1.set_magnitude(50)
-            ray_offset2.set_magnitude(50)
-            self._rays.append(ray_central)
-            self._rays.append(ray_offset1)
-            self._rays.append(ray_offset2)
-
-        self._order_rays()
-
-    def _gen_offset_ray(self, ray, offset):
-        """Calculates the parameters to generate a ray at a given angle offset from another
-        And returns the ray generated via these parameters"""
-        y_change = ray.get_direction().y
-        x_change = ray.get_direction().x
-        if y_change < 0 and x_change > 0:
-            quad = "TR"
-            angle = ray.get_bearing()
-
-        elif y_change > 0 and x_change > 0:
-            quad = "BR"
-            angle = math.pi - ray.get_bearing()
-
-        elif y_change > 0 and x_change < 0:
-            quad = "BL"
-            angle = ray.get_bearing() - math.pi
-        else:
-            quad = "TL"
-            angle = (2 * math.pi) - ray.get_bearing()
-
-        angle += offset
-        # Calculate change in x and y based on new angle
-        x_change = math.sin(angle) * ray.get_distance()
-        y_change = math.cos(angle) * ray.get_distance()
-
-        # Calculate new end position of ray based upon quadrant ray is situated in
-        if quad == "TR":
-            end_x = ray.get_start_pos().x + x_change
-            end_y = ray.get_start_pos().y - y_change
-        elif quad == "BR":
-            end_x = ray.get_start_pos().x + x_change
-            end_y = ray.get_start_pos().y + y_change
-        elif quad == "BL":
-            end_x = ray.get_start_pos().x - x_change
-            end_y = ray.get_start_pos().y + y_change
-        else:
-            end_x = ray.get_start_pos().x - x_change
-            end_y = ray.get_start_pos().y - y_change
+        # Finished ray end positions are cached by quantised viewer position, occluder set version and intersect mode
+        self._visibility_cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
 
-        return Ray(ray.get_start_pos().x, ray.get_start_pos().y, end_x, end_y)
-
-    def _order_rays(self):
-        """Orders rays in list based upon their bearing via a selection sort"""
-        self.ordered_rays = []
+        self._update_rays()
+        self._ray_ends = self._get_ray_ends()
+        self._ray_bearings = [ray.get_bearing() for ray in self._rays]
+        # Visible regions and camera offset as they were last drawn
+        self._drawn_state = None
 
-        for i in range(len(self._rays)):
-            min_bearing = 10
-            for ray in self._rays:
-                if ray.get_bearing() < min_bearing:
-                    min_bearing = ray.get_bearing()
-                    min_ray = ray
-            self._rays.remove(min_ray)
-            self.ordered_rays.append(min_ray)
-        self._rays = self.ordered_rays
+    def _update_rays(self):
+        """Casts 3 rays to each corner: A central ray and an offset ray rotated to either side by OFFSETANGLE
+        Then orders all rays by bearing"""
+        while len(self._ray_pool) < 3 * len(self._corners):
+            self._ray_pool.append(Ray(0, 0, 0, 0))
+        self._rays = self._ray_pool[:3 * len(self._corners)]
+
+        pos_x = self._pos.x
+        pos_y = self._pos.y
+        for count, corner in enumerate(self._corners):
+            x_change = corner[0] - pos_x
+            y_change = corner[1] - pos_y
+            self._rays[3 * count].reset(pos_x, pos_y, corner[0], corner[1])
+            # Offset rays are extended by a magnitude of 50 so that they reach past the corner
+            self._rays[3 * count + 1].reset(pos_x, pos_y,
+                                            pos_x + (x_change * _OFFSET_COS - y_change * _OFFSET_SIN) * 50,
+                                            pos_y + (y_change * _OFFSET_COS + x_change * _OFFSET_SIN) * 50)
+            self._rays[3 * count + 2].reset(pos_x, pos_y,
+                                            pos_x + (x_change * _OFFSET_COS + y_change * _OFFSET_SIN) * 50,
+                                            pos_y + (y_change * _OFFSET_COS - x_change * _OFFSET_SIN) * 50)
+
+        self._rays.sort(key=Ray.get_bearing)
+
+    def set_intersect_mode(self, mode):
+        """Selects how intersects are found: "scalar" tests each ray and edge pair in turn,
+        "numpy" tests all pairs at once, falling back to scalar if NumPy isn't installed
+        And "grid" only tests each ray against the edges in the grid cells it passes through
+        Rays cached from the previous mode are no longer used, so the next update casts with the new mode"""
+        self._intersect_mode = mode
+
+    def get_intersect_mode(self):
+        return self._intersect_mode
 
     def _update_intersects(self):
         """Uses the find intersect method to find the shortest given intersect for all rays
         And updates rays accordingly"""
+        if self._intersect_mode == "numpy" and np is not None:
+            self._update_intersects_vectorised()
+            return
+        elif self._intersect_mode == "grid":
+            self._update_intersects_grid()
+            return
+
         for ray in self._rays:
             max_t1 = None
 
@@ -208,37 +297,339 @@ class RaySource:
             if max_t1 is not None:
                 ray.set_magnitude(max_t1)
 
-    def check_visible(self, pos):
-        """Tests if a given point is located within the visible regions outlined by the rays"""
-        for i in range(len(self._rays)):
-            point1 = round(self._pos.x), round(self._pos.y)
-            point2 = round(self._rays[i - 1].get_end_pos().x), round(self._rays[i - 1].get_end_pos().y)
-            point3 = round(self._rays[i].get_end_pos().x), round(self._rays[i].get_end_pos().y)
+    def _get_ray_ends(self):
+        return [(ray.end_x, ray.end_y) for ray in self._rays]
 
-            big_a = round(_calculate_triangle_area(point1, point2, point3))
-            a1 = round(_calculate_triangle_area(pos, point2, point3))
-            a2 = round(_calculate_triangle_area(point1, pos, point3))
-            a3 = round(_calculate_triangle_area(point1, point2, pos))
+    def _update_intersects_grid(self):
+        """Finds the closest intersect of each ray by walking it through the edge grid"""
+        if self._edge_grid is None:
+            self._edge_grid = EdgeGrid(self._edges, EDGECELLSIZE)
+            self._occluder_set[3] = self._edge_grid
+        for ray in self._rays:
+            max_t1 = self._edge_grid.find_closest_intersect(ray)
+            if max_t1 is not None:
+                ray.set_magnitude(max_t1)
 
-            if abs(a1 + a2 + a3 - big_a) < 5:
-                return True
-        return False
+    def _update_intersects_vectorised(self):
+        """Packs rays and edges into arrays so the closest intersect of every ray is found in one operation"""
+        if not self._rays or not self._edges:
+            return
+        rays = np.array([(ray.start_x, ray.start_y, ray.dir_x, ray.dir_y) for ray in self._rays])
+        if self._edge_array is None:
+            self._edge_array = pack_edges(self._edges)
+            self._occluder_set[4] = self._edge_array
+        for ray, max_t1 in zip(self._rays, _find_closest_intersects(rays, self._edge_array).tolist()):
+            if max_t1 != math.inf:
+                ray.set_magnitude(max_t1)
+
+    def check_visible(self, pos):
+        """Tests if a given point is located within the visible regions outlined by the rays"""
+        return self.check_visible_many([pos])[0]
+
+    def check_visible_many(self, positions):
+        """Tests a list of points against the visible regions at once, returning a list of booleans
+        Each point's bearing is binary searched among the ordered ray bearings to find the triangle between
+        Consecutive rays it could lie in, and it is visible if it is on the same side of that triangle's far edge
+        As the ray source. Triangles spanning half a turn or more are never visible"""
+        if not self._ray_ends or not positions:
+            return [False] * len(positions)
+        if np is not None:
+            return self._check_visible_vectorised(positions)
+
+        pos_x = self._pos[0]
+        pos_y = self._pos[1]
+        ray_count = len(self._ray_ends)
+        visible = []
+        for point_x, point_y in positions:
+            bearing = math.atan2(point_x - pos_x, pos_y - point_y)
+            if bearing < 0:
+                bearing += 2 * math.pi
+            index = bisect_right(self._ray_bearings, bearing)
+            prev_index = (index - 1) % ray_count
+            index %= ray_count
+            if (self._ray_bearings[index] - self._ray_bearings[prev_index]) % (2 * math.pi) >= math.pi:
+                visible.append(False)
+                continue
+
+            start_x, start_y = self._ray_ends[prev_index]
+            end_x, end_y = self._ray_ends[index]
+            point_side = (end_x - start_x) * (point_y - start_y) - (end_y - start_y) * (point_x - start_x)
+            source_side = (end_x - start_x) * (pos_y - start_y) - (end_y - start_y) * (pos_x - start_x)
+            visible.append(point_side * source_side >= 0)
+        return visible
+
+    def _check_visible_vectorised(self, positions):
+        """Version of check_visible_many that tests all points with array operations"""
+        points = np.array(positions, dtype=float).reshape(-1, 2)
+        bearings = np.array(self._ray_bearings)
+        ends = np.array(self._ray_ends)
+        pos_x = self._pos[0]
+        pos_y = self._pos[1]
+
+        point_bearings = np.arctan2(points[:, 0] - pos_x, pos_y - points[:, 1]) % (2 * math.pi)
+        indexes = np.searchsorted(bearings, point_bearings, side="right")
+        prev_indexes = (indexes - 1) % len(bearings)
+        indexes %= len(bearings)
+        narrow = (bearings[indexes] - bearings[prev_indexes]) % (2 * math.pi) < math.pi
+
+        start = ends[prev_indexes]
+        end = ends[indexes]
+        point_side = (end[:, 0] - start[:, 0]) * (points[:, 1] - start[:, 1]) - \
+                     (end[:, 1] - start[:, 1]) * (points[:, 0] - start[:, 0])
+        source_side = (end[:, 0] - start[:, 0]) * (pos_y - start[:, 1]) - (end[:, 1] - start[:, 1]) * (pos_x - start[:, 0])
+        return (narrow & (point_side * source_side >= 0)).tolist()
+
+    def get_visible_polygon(self):
+        """Returns the visible regions as a single polygon made of the ray end positions in order of bearing
+        The source position is included wherever consecutive rays are half a turn or more apart"""
+        polygon = []
+        for count in range(len(self._ray_ends)):
+            if (self._ray_bearings[count] - self._ray_bearings[count - 1]) % (2 * math.pi) >= math.pi:
+                polygon.append((self._pos[0], self._pos[1]))
+            polygon.append(self._ray_ends[count])
+        return polygon
+
+    def needs_redraw(self, cam_offset):
+        """Returns True if the visible regions or camera offset have changed since they were last drawn"""
+        return self._drawn_state != (self._pos[0], self._pos[1], self._ray_ends, tuple(cam_offset))
 
     def draw_visible_regions(self, screen, cam_offset):
         """Draws green coloured overlay on screen to show player the visible/not visible regions"""
-        x_ofs = cam_offset[0]
-        y_ofs = cam_offset[1]
-        for i in range(len(self._rays)):
-            pg.gfxdraw.filled_trigon(screen, round(self._pos.x + x_ofs), round(self._pos.y + y_ofs),
-                                     round(self._rays[i - 1].get_end_pos().x + x_ofs),
-                                     round(self._rays[i - 1].get_end_pos().y + y_ofs),
-                                     round(self._rays[i].get_end_pos().x + x_ofs),
-                                     round(self._rays[i].get_end_pos().y + y_ofs), GREEN)
-
-    def update(self, new_pos, new_corners, new_edges):
-        """Method called when either position needs to be updated or corners/edges have changed"""
-        self._pos = new_pos
-        self._corners = new_corners
-        self._edges = new_edges
+        self._drawn_state = self._pos[0], self._pos[1], self._ray_ends, tuple(cam_offset)
+        polygon = self.get_visible_polygon()
+        if len(polygon) >= 3:
+            pg.gfxdraw.filled_polygon(screen, [(round(point[0] + cam_offset[0]), round(point[1] + cam_offset[1]))
+                                               for point in polygon], GREEN)
+
+    def _select_occluder_set(self, corners, edges, edge_array):
+        """Makes the given corners and edges current, reusing the version and packed edges of the set if it was seen
+        Recently, sets are told apart by identity so callers should pass the same lists each time for a set"""
+        key = id(corners), id(edges)
+        if key in self._occluder_sets:
+            self._occluder_sets.move_to_end(key)
+        else:
+            # The lists are kept in the entry so their ids can't be reused by other lists while it exists
+            self._occluder_set_count += 1
+            self._occluder_sets[key] = [corners, edges, self._occluder_set_count, None, None]
+            if len(self._occluder_sets) > max(VISIBILITYCACHESIZE, 1):
+                self._occluder_sets.popitem(last=False)
+        self._occluder_set = self._occluder_sets[key]
+        if edge_array is not None:
+            self._occluder_set[4] = edge_array
+        self._corners, self._edges, self._edge_version, self._edge_grid, self._edge_array = self._occluder_set
+
+    def update(self, new_pos, new_corners, new_edges, edge_array=None):
+        """Method called when either position needs to be updated or corners/edges have changed
+        Rays are only recast if the position, rounded to VISIBILITYQUANTUM pixels, isn't in the cache
+        For the current corners/edges, otherwise the cached rays from a position within the same rounding are used
+        The edges may be given already packed by pack_edges so they don't need packing here"""
+        if new_edges is not self._edges or new_corners is not self._corners:
+            self._select_occluder_set(new_corners, new_edges, edge_array)
+
+        key = (round(new_pos[0] / VISIBILITYQUANTUM), round(new_pos[1] / VISIBILITYQUANTUM), self._edge_version,
+               self._intersect_mode)
+        if key in self._visibility_cache:
+            self._cache_hits += 1
+            self._visibility_cache.move_to_end(key)
+            self._pos, self._ray_ends, self._ray_bearings = self._visibility_cache[key]
+            return
+
+        self._cache_misses += 1
+        self._pos = pg.Vector2(new_pos)
         self._update_rays()
         self._update_intersects()
+        self._ray_ends = self._get_ray_ends()
+        self._ray_bearings = [ray.get_bearing() for ray in self._rays]
+
+        if VISIBILITYCACHESIZE > 0:
+            self._visibility_cache[key] = self._pos, self._ray_ends, self._ray_bearings
+            if len(self._visibility_cache) > VISIBILITYCACHESIZE:
+                self._visibility_cache.popitem(last=False)
+
+    def get_cache_hits(self):
+        return self._cache_hits
+
+    def get_cache_misses(self):
+        return self._cache_misses
+
+    def get_cache_hit_rate(self):
+        if self._cache_hits + self._cache_misses == 0:
+            return 0
+        return self._cache_hits / (self._cache_hits + self._cache_misses)
+
+
+def _find_portal(rect1, rect2):
+    """Returns the span (start and end point) along which two rectangles touch, or None if they don't
+    As rectangles are the floor of rooms and corridors any span they share is an open doorway"""
+    for near_x, far_x in ((rect1[2], rect2[0]), (rect2[2], rect1[0])):
+        if near_x == far_x and min(rect1[3], rect2[3]) > max(rect1[1], rect2[1]):
+            return (near_x, max(rect1[1], rect2[1])), (near_x, min(rect1[3], rect2[3]))
+    for near_y, far_y in ((rect1[3], rect2[1]), (rect2[3], rect1[1])):
+        if near_y == far_y and min(rect1[2], rect2[2]) > max(rect1[0], rect2[0]):
+            return (max(rect1[0], rect2[0]), near_y), (min(rect1[2], rect2[2]), near_y)
+    return None
+
+
+def _clip_polygon(points, pos, a, b):
+    """Clips a convex polygon to the half-plane of points p where a * (p.x - pos.x) + b * (p.y - pos.y) >= 0"""
+    clipped = []
+    for count in range(len(points)):
+        p1 = points[count - 1]
+        p2 = points[count]
+        d1 = a * (p1[0] - pos[0]) + b * (p1[1] - pos[1])
+        d2 = a * (p2[0] - pos[0]) + b * (p2[1] - pos[1])
+        if d1 >= 0:
+            clipped.append(p1)
+        # Adds the point where the polygon side crosses the half-plane boundary
+        if (d1 < 0 <= d2 and d2 != 0) or (d2 < 0 <= d1 and d1 != 0):
+            t = d1 / (d1 - d2)
+            clipped.append((p1[0] + (p2[0] - p1[0]) * t, p1[1] + (p2[1] - p1[1]) * t))
+    return clipped
+
+
+def _clip_segment(start, end, pos, a, b):
+    """Clips a line segment to the same half-plane as _clip_polygon, returning None if none of it remains"""
+    d1 = a * (start[0] - pos[0]) + b * (start[1] - pos[1])
+    d2 = a * (end[0] - pos[0]) + b * (end[1] - pos[1])
+    if d1 < 0 and d2 < 0:
+        return None
+    crossing = None
+    if d1 < 0 or d2 < 0:
+        t = d1 / (d1 - d2)
+        crossing = start[0] + (end[0] - start[0]) * t, start[1] + (end[1] - start[1]) * t
+    if d1 < 0:
+        return crossing, end
+    elif d2 < 0:
+        return start, crossing
+    return start, end
+
+
+class PortalSource:
+    """Visibility for levels made up of axis-aligned rectangles, used as an alternative to RaySource
+    Rectangles containing the source are fully visible, and rectangles through a doorway are clipped to the wedge
+    Of that doorway seen from the source, with the wedge narrowed again at each further doorway
+    Corners are expected in groups of four per rectangle as given by get_corners, so edges aren't used"""
+    def __init__(self, pos, corners, edges):
+        self._pos = pos
+        self._corners = None
+        self._rects = []
+        self._portals = []
+        self._polygons = []
+        self._drawn_state = None
+        self.update(pos, corners, edges)
+
+    def _update_rects(self):
+        """Rebuilds the rectangles and the doorways between them from the corners"""
+        self._rects = []
+        for count in range(0, len(self._corners) - 3, 4):
+            top_left = self._corners[count]
+            bottom_right = self._corners[count + 2]
+            self._rects.append((top_left[0], top_left[1], bottom_right[0], bottom_right[1]))
+
+        # Each rectangle has a list of (neighbouring rectangle index, doorway) pairs
+        self._portals = [[] for rect in self._rects]
+        for index1 in range(len(self._rects)):
+            for index2 in range(index1 + 1, len(self._rects)):
+                portal = _find_portal(self._rects[index1], self._rects[index2])
+                if portal is not None:
+                    self._portals[index1].append((index2, portal))
+                    self._portals[index2].append((index1, portal))
+
+    def _look_through(self, index, portal, wedge, visited):
+        """Adds the part of a rectangle visible through a doorway, then continues through its other doorways"""
+        start, end = portal
+        if wedge is not None:
+            # Doorway is first cut down to the part lying within the wedge it was seen through
+            portal = _clip_segment(start, end, self._pos, -wedge[0][1], wedge[0][0])
+            if portal is None:
+                return
+            portal = _clip_segment(*portal, self._pos, wedge[1][1], -wedge[1][0])
+            if portal is None:
+                return
+            start, end = portal
+
+        dir1 = start[0] - self._pos[0], start[1] - self._pos[1]
+        dir2 = end[0] - self._pos[0], end[1] - self._pos[1]
+        cross = dir1[0] * dir2[1] - dir1[1] * dir2[0]
+        if cross == 0:
+            return
+        elif cross < 0:
+            dir1, dir2 = dir2, dir1
+
+        # Wedge is the region clockwise of dir1 and anticlockwise of dir2
+        x1, y1, x2, y2 = self._rects[index]
+        polygon = _clip_polygon([(x1, y1), (x2, y1), (x2, y2), (x1, y2)], self._pos, -dir1[1], dir1[0])
+        polygon = _clip_polygon(polygon, self._pos, dir2[1], -dir2[0])
+        if len(polygon) >= 3:
+            self._polygons.append(polygon)
+
+        visited = visited | {index}
+        for neighbour, next_portal in self._portals[index]:
+            if neighbour not in visited:
+                self._look_through(neighbour, next_portal, (dir1, dir2), visited)
+
+    def check_visible(self, pos):
+        """Tests if a given point is located within the visible regions"""
+        return self.check_visible_many([pos])[0]
+
+    def check_visible_many(self, positions):
+        """Tests a list of points against the visible regions, returning a list of booleans"""
+        visible = []
+        for point in positions:
+            for polygon in self._polygons:
+                for count in range(len(polygon)):
+                    p1 = polygon[count - 1]
+                    p2 = polygon[count]
+                    # Polygons are clockwise on screen so points inside are never to the left of a side
+                    if (p2[0] - p1[0]) * (point[1] - p1[1]) - (p2[1] - p1[1]) * (point[0] - p1[0]) < 0:
+                        break
+                else:
+                    visible.append(True)
+                    break
+            else:
+                visible.append(False)
+        return visible
+
+    def needs_redraw(self, cam_offset):
+        """Returns True if the visible regions or camera offset have changed since they were last drawn"""
+        return self._drawn_state != (self._polygons, tuple(cam_offset))
+
+    def draw_visible_regions(self, screen, cam_offset):
+        """Draws green coloured overlay on screen to show player the visible/not visible regions"""
+        self._drawn_state = self._polygons, tuple(cam_offset)
+        for polygon in self._polygons:
+            pg.gfxdraw.filled_polygon(screen, [(round(point[0] + cam_offset[0]), round(point[1] + cam_offset[1]))
+                                               for point in polygon], GREEN)
+
+    def update(self, new_pos, new_corners, new_edges, edge_array=None):
+        """Method called when either position needs to be updated or corners have changed"""
+        if new_corners is not self._corners:
+            self._corners = new_corners
+            self._update_rects()
+        self._pos = new_pos[0], new_pos[1]
+
+        self._polygons = []
+        source_rects = set()
+        for index, (x1, y1, x2, y2) in enumerate(self._rects):
+            if x1 <= self._pos[0] <= x2 and y1 <= self._pos[1] <= y2:
+                source_rects.add(index)
+                self._polygons.append([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+        for index in source_rects:
+            for neighbour, portal in self._portals[index]:
+                if neighbour not in source_rects:
+                    self._look_through(neighbour, portal, None, source_rects)
+
+
+def pack_edges(edges):
+    """Returns the start and direction of each edge packed into an array for the vectorised intersect method
+    Or None if NumPy isn't installed"""
+    if np is None:
+        return None
+    return np.array([(edge.start_x, edge.start_y, edge.dir_x, edge.dir_y) for edge in edges])
+
+
+def create_visibility_source(pos, corners, edges, engine=VISIBILITYENGINE):
+    """Returns the visibility engine selected in settings: "rays" for RaySource or "portals" for PortalSource"""
+    if engine == "portals":
+        return PortalSource(pos, corners, edges)
+    return RaySource(pos, corners, edges)
@@ -23,3 +23,41 @@ SHOWGRIDLINES = True
 
 PLAYERSPEED = 300
 
+# Enemy pathfinding: "flowfield" follows the shared field towards the player, "astar" searches per enemy,
+# "hierarchical" plans over the rooms and corridors before searching only the first segment per enemy
+# "scheduled" queues per enemy searches that are spread over frames within PATHBUDGET tiles per frame
+# "batch" sends each frame's searches to a pool of worker processes
+# And "incremental" keeps each enemy's search between requests (Moving Target D* Lite), only searching again
+# Where the enemy or its target has moved
+PATHMODE = "flowfield"
+PATHBUDGET = 400
+
+# Tile search used by Pathfinder: "astar" expands every adjacent tile, "jps" only expands jump points
+PATHSEARCH = "astar"
+
+# Max number of routes kept in each level's route cache
+ROUTECACHESIZE = 256
+
+# Ray and edge intersects used for visibility: "scalar" tests each pair in turn, "numpy" tests all pairs at once
+# And "grid" walks each ray through a grid of cells holding the edges, testing only edges in cells it passes
+RAYINTERSECT = "numpy"
+
+# Visibility is cached for the last VISIBILITYCACHESIZE viewer positions (0 disables the cache),
+# With viewer position rounded to the nearest VISIBILITYQUANTUM pixels
+VISIBILITYCACHESIZE = 64
+VISIBILITYQUANTUM = 4
+
+# Visibility engine: "rays" casts rays to every corner (RaySource), "portals" clips the room and corridor
+# Rectangles to the doorways seen from the player (PortalSource)
+VISIBILITYENGINE = "rays"
+
+# Enemy visibility: "polygon" tests enemies against the visibility engine's regions, "fov" looks up the tile
+# Field of view found by shadowcasting up to FOVRADIUS tiles from the player
+# The camera stops at the edges of the map so the player can be in a corner of the screen, hence the radius
+# Covers the whole screen diagonal (plus the tiles the player and the screen corner are part way across)
+ENEMYVISIBILITY = "polygon"
+FOVRADIUS = int((WIDTH ** 2 + HEIGHT ** 2) ** 0.5 / TILESIZE) + 2
+
+# Neighbourhoods of rooms and corridors are precomputed up to NEIGHBOURHOODHOPS steps
+# Through the graph of rooms and the corridors joining them
+NEIGHBOURHOODHOPS = 2
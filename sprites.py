@@ -48,10 +48,9 @@ class Bullet(GenericSprite):
 
     def _collides_with(self, x, y):
         """Identify if a bullet has collided with either a wall/enemy or player"""
-        for wall in self.game.walls:
-            if wall.rect.y - self.rect.h < y < wall.rect.y + wall.rect.h:
-                if wall.rect.x - self.rect.w < x < wall.rect.x + wall.rect.w:
-                    return wall
+        wall = self.game.map.get_colliding_wall(x, y, self.rect.w, self.rect.h)
+        if wall is not None:
+            return wall
         # If bullet shot by player will not be able to damage player
         if type(self.source) is Player:
             for enemy in self.game.enemies:
@@ -139,11 +138,7 @@ class Player(GenericSprite):
 
     def _collides_with_wall(self, x, y):
         """Tests if player has collided with any given wall"""
-        for wall in self.game.walls:
-            if wall.rect.y - self.rect.h < y < wall.rect.y + wall.rect.h:
-                if wall.rect.x - self.rect.w < x < wall.rect.x + wall.rect.w:
-                    return wall
-        return None
+        return self.game.map.get_colliding_wall(x, y, self.rect.w, self.rect.h)
 
 
     def _check_enemy_collisions(self):
@@ -278,14 +273,8 @@ class Stair(GenericSprite):
 
 
 class Enemy(GenericSprite):
-    count = 0
-    spaces_occupied = {}
-
     def __init__(self, game, x, y):
         super().__init__(game, x, y)
-        Enemy.count += 1
-        self.id = Enemy.count
-        Enemy.spaces_occupied[self.id] = None
         self.image = pg.image.load("sprites/enemy.png").convert_alpha()
         self.hp = round(5*math.sqrt(game.get_comp_diff()))
         self.hp_max = round(5*math.sqrt(game.get_comp_diff()))
@@ -300,14 +289,23 @@ class Enemy(GenericSprite):
         self._current_room = self.game.map.get_room_or_corridor(self.center_pos)
 
         self._path = None
+        self._path_goal = None
+        # Keeps the search between requests so it is updated rather than searched for from scratch
+        self._incremental_planner = None
+        if PATHMODE == "incremental":
+            self._incremental_planner = IncrementalPlanner(self.game.map.get_passability_grid())
         self._current_target = None
 
-        self.default_invalid_targets = None
         self._weapon = Pistol(self.game, self, max_mag_ammo_scalar=100, fire_rate_scalar=0.4, shot_speed_scalar=0.6, damage_scalar=0.6)
 
     def move_to_player(self):
         if self._path is None:
             self._path = self.path_to_player()
+            if self._path is None:
+                # Route has been requested and is still being searched for, or no target could be reached
+                self.vel.x = 0
+                self.vel.y = 0
+                return
 
         if self._current_target is None:
             try:
@@ -315,9 +313,15 @@ class Enemy(GenericSprite):
             except:
                 self._to_path = False
 
-        if self.check_next_tile_target(self.center_pos, self._current_target, 10):
+        if self._current_target is not None and self.check_next_tile_target(self.center_pos, self._current_target, 10):
             if self._path.length() != 0:
                 self._current_target = self._path.pop()
+            elif self._path_goal is not None and self._current_target != self._path_goal:
+                # Route only covered the first segment towards the goal so the next one is requested
+                self._path = None
+            elif PATHMODE in ("scheduled", "batch") and self.game.map.get_path_scheduler().is_pending(self):
+                # Previous route ran out before the requested route arrived
+                self._path = None
             else:
                 self._to_path = False
 
@@ -343,33 +347,90 @@ class Enemy(GenericSprite):
             return False
 
     def select_target_pos(self):
-        base_pos = approximate_tile_pos(self.game.player)
-        while True:
-            x_deviation = random.randint(-2,2)
-            y_deviation = random.randint(-2,2)
-            test_pos = (base_pos[0] + x_deviation)*32, (base_pos[1] + y_deviation)*32
-            if not self.check_space_occupied(test_pos):
-                if self.game.map.get_room_or_corridor(test_pos) != False:
-                    Enemy.spaces_occupied[self.id] = test_pos
-                    return test_pos[0]/32, test_pos[1]/32
+        """Reserves and returns a random free tile within 2 tiles of the player that the enemy can reach
+        If all of them are taken the nearest free tile further out is used, or else the enemy's own tile"""
+        reservations = self.game.reservations
+        player_tile = approximate_tile_pos(self.game.player)
+        own_tile = int(approximate_tile_pos(self)[0]), int(approximate_tile_pos(self)[1])
+        target_tiles = [tile for tile in reservations.get_free_tiles(player_tile, 2, self) if self.check_valid_target(tile)]
+        if target_tiles:
+            target_tile = random.choice(target_tiles)
+        else:
+            target_tile = next((tile for tile in reservations.get_free_tiles(player_tile, 6, self)
+                                if self.check_valid_target(tile)), own_tile)
+        reservations.claim(self, target_tile)
+        return target_tile
+
+    def check_valid_target(self, tile):
+        # Tiles the enemy has no route to are rejected without running a search
+        if not self.game.map.same_component(approximate_tile_pos(self), tile):
+            return False
+        return self.game.map.get_room_or_corridor((tile[0]*32, tile[1]*32)) != False
 
     def path_to_player(self):
-        test_pos = self.select_target_pos()
-        self.router = Pathfinder(approximate_tile_pos(self), test_pos, self.game.map.get_data_map())
-        while not self.router.is_valid_path():
-            room = self.game.map.get_room_or_corridor((test_pos[0]*32,test_pos[1]*32))
-
-            self.router = Pathfinder(approximate_tile_pos(self), self.select_target_pos(), self.game.map.get_data_map())
-        path = self.router.get_shortest_route()
-        return path
-
-    def check_space_occupied(self, tile_pos):
-        for kv_pair in Enemy.spaces_occupied.items():
-            if self.id == kv_pair[0] and tile_pos == kv_pair[1]:
-                return False
-            elif tile_pos == kv_pair[1]:
-                return True
-        return False
+        if PATHMODE == "flowfield":
+            return self.follow_flow_field()
+        elif PATHMODE == "hierarchical":
+            return self.plan_to_player()
+        elif PATHMODE in ("scheduled", "batch"):
+            self.request_route()
+            return None
+        elif PATHMODE == "incremental":
+            return self._incremental_planner.find_route(approximate_tile_pos(self), self.select_target_pos())
+        # Targets are only selected from tiles the enemy can reach, so a route is found on the first attempt
+        return self.game.map.find_route(approximate_tile_pos(self), self.select_target_pos())
+
+    def follow_flow_field(self):
+        """Builds a route by reading the shared flow field one step at a time until a free tile
+        within the player's surrounding 5x5 area is reached"""
+        flow_field = self.game.map.get_flow_field()
+        # Field is only rebuilt here, when an enemy needs it and the player has moved to another tile
+        flow_field.update(approximate_tile_pos(self.game.player))
+        player_tile = flow_field.get_target()
+        tile = approximate_tile_pos(self)
+        route = []
+        while True:
+            if abs(tile[0] - player_tile[0]) <= 2 and abs(tile[1] - player_tile[1]) <= 2:
+                if self.game.reservations.is_free(tile, self):
+                    break
+            next_tile = flow_field.get_next_step(tile)
+            if next_tile is None:
+                break
+            route.append(next_tile)
+            tile = next_tile
+
+        self.game.reservations.claim(self, tile)
+        route.reverse()
+        return Stack(route)
+
+    def plan_to_player(self):
+        """Requests the next segment of a route towards the same target tile from the level's room planner"""
+        planner = self.game.map.get_planner()
+        if self._path_goal is None:
+            self._path_goal = self.select_target_pos()
+        return planner.find_route(approximate_tile_pos(self), self._path_goal)
+
+    def request_route(self):
+        """Submits a path request to the level's path scheduler, prioritised by distance to the player"""
+        scheduler = self.game.map.get_path_scheduler()
+        if not scheduler.is_pending(self):
+            tile_pos = approximate_tile_pos(self)
+            priority = get_tile_distance(tile_pos, approximate_tile_pos(self.game.player))
+            scheduler.submit(self, tile_pos, self.select_target_pos(), priority)
+
+    def cancel_route_request(self):
+        # Removed enemies must not keep using the path scheduler's budget or have routes handed back to them
+        if PATHMODE in ("scheduled", "batch"):
+            self.game.map.get_path_scheduler().cancel(self)
+
+    def receive_route(self, route):
+        """Called by the path scheduler once a requested route has been found"""
+        if route is None:
+            # Target could not be reached so a different target is requested, searched from the next update
+            self.request_route()
+            return
+        self._path = route
+        self._current_target = None
 
     def damage(self, damage):
         self.hp -= damage
@@ -379,12 +440,16 @@ class Enemy(GenericSprite):
         if self.hp <= 0:
             self.game.gui.remove_elements(tracking=self)
             self.game.gui.get_element("scorecounter").increment_score(10)
+            self.game.reservations.release(self)
+            self.cancel_route_request()
             self.kill()
             del self
             return
 
     def destroy(self):
         self.game.gui.remove_elements(tracking=self)
+        self.game.reservations.release(self)
+        self.cancel_route_request()
         self.kill()
         del self
         return
@@ -401,16 +466,24 @@ class Enemy(GenericSprite):
     def set_to_path(self, new_bool):
         self._to_path = new_bool
         if self._to_path:
-            self._path = None
+            self._path_goal = None
+            if PATHMODE in ("scheduled", "batch"):
+                # Previous route is followed until the requested route arrives
+                self.game.map.get_path_scheduler().cancel(self)
+                self.request_route()
+            else:
+                self._path = None
+        elif PATHMODE in ("scheduled", "batch"):
+            self.game.map.get_path_scheduler().cancel(self)
 
 
     def update(self):
-        if self.default_invalid_targets is None:
-            self.default_invalid_targets = [(int(wall.pos.x), int(wall.pos.y)) for wall in self.game.walls]
         if self._active:
             self.move_to_player()
             self._weapon.update()
-            self.attack()
+            # Only fires when no wall stands between the enemy and the player
+            if self.game.map.has_line_of_sight(approximate_tile_pos(self), approximate_tile_pos(self.game.player)):
+                self.attack()
             self.pos.x += self.vel.x * self.game.dt
             self.pos.y += self.vel.y * self.game.dt
             self.center_pos.x += self.vel.x * self.game.dt
@@ -1,7 +1,7 @@
 from settings import *
 from sprites import *
 from levelgen import LevelGenerator
-from raycast import Edge
+from raycast import Edge, pack_edges
 import random
 import math
 
@@ -13,55 +13,84 @@ def lower(a, b):
         return b
 
 
-class AdjacencyMatrix:
-    """Functions as boolean array to inform whether any given node is connected
-    /adjacent to any other given node. As well can be used to determine adjacent nodes and edges"""
+class AdjacencyGraph:
+    """Adjacency lists linking rooms (nodes) to the corridors (edges) joining them, held in dictionaries
+    So queries cost no more than the number of connections, rather than scanning every node or edge.
+    Neighbourhoods of every room and corridor are precomputed up to a given number of hops"""
 
-    def __init__(self, nodes, edges):
+    def __init__(self, nodes, edges, hops=0):
         self._nodes = nodes
         self._edges = edges
-        # Order of nodes in rows and columns mirrors order in list attribute nodes
-        self._matrix = [[False for c1 in range(len(nodes))] for c2 in range(len(nodes))]
-        self._fill_matrix()
-
-    def _fill_matrix(self):
-        """Private method that initialises the matrix with values pertaining to input nodes and edges"""
+        # Room -> corridors and corridor -> rooms, kept in the same order as the lists passed in
+        self._node_edges = {node: [] for node in nodes}
+        self._edge_nodes = {}
+        self._adjacent_nodes = {node: {} for node in nodes}
+        self._fill_lists()
+
+        # Neighbourhoods for each number of hops up to hops, indexed by hops and then room or corridor
+        self._neighbourhoods = [{region: self._find_neighbourhood(region, count) for region in [*nodes, *edges]}
+                                for count in range(hops + 1)]
+
+    def _fill_lists(self):
+        """Private method that initialises the adjacency lists with values pertaining to input nodes and edges"""
         for edge in self._edges:
             node1 = edge.get_left_room()
             node2 = edge.get_right_room()
-            pos1 = self._nodes.index(node1)
-            pos2 = self._nodes.index(node2)
-            self._matrix[pos1][pos2] = True
-            self._matrix[pos2][pos1] = True
+            self._edge_nodes[edge] = node2, node1
+            self._node_edges[node1].append(edge)
+            if node2 is not node1:
+                self._node_edges[node2].append(edge)
+            # Dictionaries without values act as ordered sets
+            self._adjacent_nodes[node1][node2] = None
+            self._adjacent_nodes[node2][node1] = None
+
+        # Adjacent nodes are put in the same order as the list of nodes, so queries can return them as they are
+        node_indexes = {node: index for index, node in enumerate(self._nodes)}
+        for node, adjacencies in self._adjacent_nodes.items():
+            self._adjacent_nodes[node] = dict.fromkeys(sorted(adjacencies, key=node_indexes.__getitem__))
+
+    def _find_neighbourhood(self, region, hops):
+        """Breadth first search from a room or corridor, stepping between rooms and corridors that touch"""
+        found = {region: None}
+        frontier = [region]
+        for count in range(hops):
+            next_frontier = []
+            for current in frontier:
+                for linked in self.get_linked_regions(current):
+                    if linked not in found:
+                        found[linked] = None
+                        next_frontier.append(linked)
+            frontier = next_frontier
+        return tuple(found)
 
     def get_adjacent_nodes(self, node):
         """Returns all nodes adjacent to the input node"""
-        adjacencies = self._matrix[self._nodes.index(node)]
-        adjacent_nodes = []
-        for count in range(len(adjacencies)):
-            if adjacencies[count]:
-                adjacent_nodes.append(self._nodes[count])
-        return adjacent_nodes
+        return list(self._adjacent_nodes[node])
 
     def get_connected_edges(self, node):
         """Returns all edges connected to a given node"""
-        connected_edges = []
-        for edge in self._edges:
-            node1 = edge.get_left_room()
-            node2 = edge.get_right_room()
-            if node == node1 or node == node2:
-                connected_edges.append(edge)
-        return connected_edges
+        return list(self._node_edges[node])
 
     def get_connected_nodes(self, edge):
         """Returns nodes that are conected to a given edge"""
-        return edge.get_right_room(), edge.get_left_room()
+        return self._edge_nodes[edge]
+
+    def get_linked_regions(self, region):
+        """Returns the corridors of a room, or the rooms of a corridor"""
+        if region in self._node_edges:
+            return self._node_edges[region]
+        return self._edge_nodes[region]
+
+    def get_neighbourhood(self, region, hops):
+        """Returns the rooms and corridors at most hops steps from a room or corridor (including itself)
+        Ordered by the number of steps, precomputed neighbourhoods are returned without searching"""
+        if hops < len(self._neighbourhoods):
+            return self._neighbourhoods[hops][region]
+        return self._find_neighbourhood(region, hops)
 
     def test_adjacent(self, node1, node2):
         """Returns True/False to query if two given nodes are adjacent"""
-        index1 = self._nodes.index(node1)
-        index2 = self._nodes.index(node2)
-        return self._matrix[index1][index2]
+        return node2 in self._adjacent_nodes[node1]
 
 
 def get_corners(room):
@@ -83,169 +112,72 @@ def get_edges(corners):
     return edges
 
 
-def _find_overlap_edges(edges):
-    """Returns a list of overlaps where each element in the list is a list of two or more edges
-    The first element in each of said list is the long edge (the room edge)
-    The following elements in list are corridor edges sorted by order of start pos
-    Where left most element is that of the furthest left/up edge start position"""
-    overlaps = []
-    has_overlapped = []
-    check_list = [*edges]
-
-    # Runs until all edges have been checked for overlaps
-    while len(check_list) != 0:
-        # Initialises variable to test for overlap
-        overlap = False
-        edge1 = check_list[0]
-        e1_dir = edge1.get_direction()
-
-        # Iterates over all remaining edges that have not yet been checked
-        for edge_count in range(1, len(check_list)):
-            edge2 = check_list[edge_count]
-            e2_dir = edge2.get_direction()
-
-            # Test if two edges are both travelling vertically and share a horizontal x start position
-            if e1_dir.x == 0 and e2_dir.x == 0 and edge1.get_start_pos().x == edge2.get_start_pos().x:
-                # Finds which edge is longer and assigns to variables as appropriate
-                long_edge = edge2
-                short_edge = edge1
-                if e1_dir.y > e2_dir.y:
-                    long_edge = edge1
-                    short_edge = edge2
-                l_srt = long_edge.get_start_pos()
-                s_srt = short_edge.get_start_pos()
-
-                # Check if the two edges overlap
-                if l_srt.y < s_srt.y and long_edge.get_end_pos().y > short_edge.get_end_pos().y:
-                    # If long edge has not overlapped with any other edges append the pair of edges to overlaps list
-                    if long_edge not in has_overlapped:
-                        overlaps.append([long_edge, short_edge])
-                    # Otherwise find's the edges existing overlap pair and appends new edge to the list
-                    else:
-                        for index, overlap in enumerate(overlaps):
-                            if overlap[0] == long_edge:
-                                overlap_index = index
-                                break
-                        # Edges are placed in length order within the overlap list
-                        if overlaps[overlap_index][1].get_start_pos().y < s_srt.y:
-                            overlaps[overlap_index].append(short_edge)
-                        else:
-                            overlaps[overlap_index].insert(1, short_edge)
-                    # Removes the short edge from the check list
-                    check_list.remove(short_edge)
-                    overlap = True
-                    # Add long edge to the has overlapped list
-                    has_overlapped.append(long_edge)
-                    # Returns to outer loop
-                    break
-
-            # Test if two edges are both travelling horizontally and share a vertical y start position
-            elif e1_dir.y == 0 and e2_dir.y == 0 and edge1.get_start_pos().y == edge2.get_start_pos().y:
-                # Finds which edge is longer and assigns to variables as appropriate
-                long_edge = edge2
-                short_edge = edge1
-                if e1_dir.x > e2_dir.x:
-                    long_edge = edge1
-                    short_edge = edge2
-                l_srt = long_edge.get_start_pos()
-                s_srt = short_edge.get_start_pos()
-
-                # Check if the two edges overlap
-                if l_srt.x < s_srt.x and long_edge.get_end_pos().x > short_edge.get_end_pos().x:
-                    # If long edge has not overlapped with any other edges append the pair of edges to overlaps list
-                    if long_edge not in has_overlapped:
-                        overlaps.append([long_edge, short_edge])
-                    # Otherwise find's the edges existing overlap pair and appends new edge to the list
-                    else:
-                        for index, overlap in enumerate(overlaps):
-                            if overlap[0] == long_edge:
-                                overlap_index = index
-                                break
-                        # Edges are placed in length order within the overlap list
-                        if overlaps[overlap_index][1].get_direction().x < short_edge.get_direction().x:
-                            overlaps[overlap_index].insert(1, short_edge)
-                        else:
-                            overlaps[overlap_index].append(short_edge)
-                    # Removes the short edge from the check list
-                    check_list.remove(short_edge)
-                    overlap = True
-                    # Add long edge to the has overlapped list
-                    has_overlapped.append(long_edge)
-                    # Returns to outer loop
-                    break
-
-        # If no overlap between edges remove current inspected edge from the check list
-        if not overlap:
-            check_list.remove(edge1)
-
-    # Return all identified overlapping edge groups
-    return overlaps
+def _bucket_edges(edges):
+    """Groups edges by the line they lie on, keyed by axis and fixed coordinate
+    Each group holds tuples of the low and high coordinate along the line and the edge itself"""
+    buckets = {}
+    for edge in edges:
+        if edge.dir_x == 0:
+            key = "V", edge.start_x
+            low, high = edge.start_y, edge.end_y
+        else:
+            key = "H", edge.start_y
+            low, high = edge.start_x, edge.end_x
+        if low > high:
+            low, high = high, low
+        if key in buckets:
+            buckets[key].append((low, high, edge))
+        else:
+            buckets[key] = [(low, high, edge)]
+    return buckets
+
+
+def _xor_spans(spans):
+    """Returns the parts of a line covered by an odd number of spans, as a list of low and high pairs
+    Every span end toggles the parity of the coverage, so a sweep over the sorted ends finds the parts"""
+    points = sorted([span[0] for span in spans] + [span[1] for span in spans])
+    parts = []
+    for count in range(1, len(points), 2):
+        # Parts that meet end to end are joined back into a single part
+        if parts and parts[-1][1] == points[count - 1]:
+            parts[-1][1] = points[count]
+        elif points[count - 1] != points[count]:
+            parts.append([points[count - 1], points[count]])
+    return parts
 
 
 def separate_edges(edges):
-    # Initialise final_edges to be all edges
-    final_edges = edges
-    overlaps = _find_overlap_edges(edges)
-    # Remove any overlapping edges from list of final_edges
-    for overlap in overlaps:
-        for edge in overlap:
-            final_edges.remove(edge)
-
-    # Iterates over each overlap group found
-    for overlap in overlaps:
-        # Check if overlap featured vertical edges
-        if overlap[0].get_direction().x == 0:
-            # Initialise key points with the start pos of first edge in overlap list (which is the long edge)
-            key_points = [overlap[0].get_start_pos().y]
-            # For all remaining edges in the overlap list, append start and end points to key_points list
-            # In order from highest point to lowest point
-            for overlap_edge in overlap[1:]:
-                p1 = overlap_edge.get_start_pos().y
-                p2 = overlap_edge.get_end_pos().y
-                if p1 < p2:
-                    key_points.append(p1)
-                    key_points.append(p2)
-                else:
-                    key_points.append(p2)
-                    key_points.append(p1)
-            key_points.append(overlap[0].get_end_pos().y)
-
-            # Instantiate new edges for each pair of key points in key_points list
-            # Where first point in pair represents start point of new edge and second represents end point of new edge
-            # Append instantiated edge to list of final_edges
-            for kp_count in range(0, len(key_points), 2):
-                srt_pt_y = key_points[kp_count]
-                end_pt_y = key_points[kp_count + 1]
-                if srt_pt_y != end_pt_y:
-                    x_pos = overlap[0].get_start_pos().x
-                    final_edges.append(Edge(x_pos, srt_pt_y, x_pos, end_pt_y))
-
-        # If overlap featured horizontal edges
-        else:
-            # Initialise key points with the start pos of first edge in overlap list (which is the long edge)
-            key_points = [overlap[0].get_start_pos().x]
-            # For all remaining edges in the overlap list, append start and end points to key_points list
-            # In order from highest point to lowest point
-            for overlap_edge in overlap[1:]:
-                p1 = overlap_edge.get_start_pos().x
-                p2 = overlap_edge.get_end_pos().x
-                if p1 < p2:
-                    key_points.append(p1)
-                    key_points.append(p2)
+    """Returns edges where any overlapping edges (corridor ends lying along a room's wall) are replaced
+    By the parts of the line covered an odd number of times, cutting the doorways out of room walls.
+    Edges are bucketed by line and swept in sorted order, edges without overlaps are returned unchanged"""
+    final_edges = []
+    for (axis, fixed), spans in _bucket_edges(edges).items():
+        if len(spans) == 1:
+            final_edges.append(spans[0][2])
+            continue
+
+        # Splits the sorted spans of each line into clusters of spans that overlap one another
+        spans.sort(key=lambda span: span[0])
+        clusters = []
+        cluster_high = None
+        for span in spans:
+            if cluster_high is not None and span[0] < cluster_high:
+                clusters[-1].append(span)
+                if span[1] > cluster_high:
+                    cluster_high = span[1]
+            else:
+                clusters.append([span])
+                cluster_high = span[1]
+
+        for cluster in clusters:
+            if len(cluster) == 1:
+                final_edges.append(cluster[0][2])
+                continue
+            for low, high in _xor_spans(cluster):
+                if axis == "V":
+                    final_edges.append(Edge(fixed, low, fixed, high))
                 else:
-                    key_points.append(p2)
-                    key_points.append(p1)
-            key_points.append(overlap[0].get_end_pos().x)
-
-            # Instantiate new edges for each pair of key points in key_points list
-            # Where first point in pair represents start point of new edge and second represents end point of new edge
-            # Append instantiated edge to list of final_edges
-            for kp_count in range(0, len(key_points), 2):
-                srt_pt_x = key_points[kp_count]
-                end_pt_x = key_points[kp_count + 1]
-                if srt_pt_x != end_pt_x:
-                    y_pos = overlap[0].get_start_pos().y
-                    final_edges.append(Edge(srt_pt_x, y_pos, end_pt_x, y_pos))
+                    final_edges.append(Edge(low, fixed, high, fixed))
 
     # Returns all the final edges which now feature no overlapping edges
     return final_edges
@@ -259,9 +191,32 @@ class Map:
         self._generator_rooms = self._generator.get_rooms()
         self._generator_corridors = self._generator.get_corridors()
         self.adjust_corridors()
-        self._adjacent_matrix = AdjacencyMatrix(self._generator_rooms, self._generator_corridors)
+        self._adjacency_graph = AdjacencyGraph(self._generator_rooms, self._generator_corridors, NEIGHBOURHOODHOPS)
+        # Row major array mapping each tile to its region's index in _regions plus 1, or 0 if outside every region
+        self._regions = [*self._generator_rooms, *self._generator_corridors]
+        self._region_ids = self._index_regions()
 
         self._map_layout = self._generator.get_layout()
+        # Passability grid is the representation used by pathfinding, collision and spawning code
+        self._grid = PassabilityGrid(self._map_layout)
+        self._walls_by_index = {}
+        self._flow_field = FlowField(self._grid)
+        # Door tiles and distances between them are cached once per level for the room level planner,
+        # Which is only built when it is the pathfinding mode in use
+        self._planner = None
+        if PATHMODE == "hierarchical":
+            self._planner = HierarchicalPlanner(self._grid, [*self._generator_rooms, *self._generator_corridors])
+        # Routes are only valid for this level's layout so each map has its own cache
+        self._route_cache = RouteCache(ROUTECACHESIZE)
+        # Both path schedulers share the same interface for submitting requests and handing back routes
+        if PATHMODE == "batch":
+            self._path_scheduler = BatchPathSolver(self._grid, self._route_cache)
+        else:
+            self._path_scheduler = PathScheduler(self._grid, self._route_cache, PATHBUDGET)
+        # Corners and separated edges of each room or corridor's neighbourhood, used for visibility
+        self._occluders = self._load_occluders()
+        # Line of sight answers between pairs of tiles, cleared at the start of every frame
+        self._line_of_sight_cache = {}
 
         self._pixelwidth = self._tilewidth * TILESIZE
         self._pixelheight = self._tileheight * TILESIZE
@@ -291,9 +246,84 @@ class Map:
         game.all_sprites.add(game.exit)
         self._load_internals(game)
 
+    def get_regions(self):
+        # Rooms followed by corridors
+        return self._regions
+
     def get_data_map(self):
         return self._map_layout
 
+    def get_passability_grid(self):
+        return self._grid
+
+    def get_flow_field(self):
+        return self._flow_field
+
+    def get_planner(self):
+        return self._planner
+
+    def get_route_cache(self):
+        return self._route_cache
+
+    def get_path_scheduler(self):
+        return self._path_scheduler
+
+    def close(self):
+        """Releases resources held for the level, such as the batch path solver's worker processes"""
+        self._path_scheduler.shutdown()
+
+    def same_component(self, pos1, pos2):
+        """Returns True if the two tiles are connected, checked in constant time via component labels"""
+        return self._grid.same_component(pos1, pos2)
+
+    def has_line_of_sight(self, start_pos, end_pos):
+        """Returns True if no wall lies on the line between the centres of two tiles
+        Answers are cached until clear_line_of_sight_cache is called, the line being the same in either direction"""
+        start_pos = int(start_pos[0]), int(start_pos[1])
+        end_pos = int(end_pos[0]), int(end_pos[1])
+        key = min(start_pos, end_pos), max(start_pos, end_pos)
+        if key not in self._line_of_sight_cache:
+            self._line_of_sight_cache[key] = self._trace_line_of_sight(*key)
+        return self._line_of_sight_cache[key]
+
+    def _trace_line_of_sight(self, start_pos, end_pos):
+        """Walks every tile the line between the tile centres passes through (DDA), stopping at the first wall
+        Crossings are ordered with integer arithmetic, and a line passing exactly through the corner of tiles
+        Is only blocked if the tiles either side of that corner are both walls"""
+        x_pos, y_pos = start_pos
+        x_change = abs(end_pos[0] - x_pos)
+        y_change = abs(end_pos[1] - y_pos)
+        x_step = 1 if end_pos[0] > x_pos else -1
+        y_step = 1 if end_pos[1] > y_pos else -1
+        x_crossings = 0
+        y_crossings = 0
+        while x_crossings < x_change or y_crossings < y_change:
+            # Compares how far along the line the next vertical and horizontal tile borders are crossed
+            decision = (2 * x_crossings + 1) * y_change - (2 * y_crossings + 1) * x_change
+            if decision < 0:
+                x_pos += x_step
+                x_crossings += 1
+            elif decision > 0:
+                y_pos += y_step
+                y_crossings += 1
+            else:
+                if not self._grid.is_passable(x_pos + x_step, y_pos) and not self._grid.is_passable(x_pos, y_pos + y_step):
+                    return False
+                x_pos += x_step
+                y_pos += y_step
+                x_crossings += 1
+                y_crossings += 1
+            if not self._grid.is_passable(x_pos, y_pos):
+                return False
+        return True
+
+    def clear_line_of_sight_cache(self):
+        self._line_of_sight_cache.clear()
+
+    def find_route(self, start_pos, end_pos):
+        """Returns a stack of tiles from start to end position or None if unreachable, reusing cached routes"""
+        return self._route_cache.get_route(start_pos, end_pos, self._grid)
+
     def get_pixelwidth(self):
         return self._pixelwidth
 
@@ -306,48 +336,126 @@ class Map:
     def get_tileheight(self):
         return self._tileheight
 
+    def _index_regions(self):
+        """Fills the region id of every tile strictly inside each room and corridor
+        Regions are filled in reverse so that rooms overwrite the corridor ends that overlap their walls"""
+        region_ids = [0] * (self._tilewidth * self._tileheight)
+        for index in range(len(self._regions) - 1, -1, -1):
+            region = self._regions[index]
+            for y_pos in range(max(region.get_y() + 1, 0), min(region.get_end_y(), self._tileheight)):
+                row_start = y_pos * self._tilewidth
+                for x_pos in range(max(region.get_x() + 1, 0), min(region.get_end_x(), self._tilewidth)):
+                    region_ids[row_start + x_pos] = index + 1
+        return region_ids
+
+    def _get_region_id(self, pos):
+        x_pos = int(pos[0] // TILESIZE)
+        y_pos = int(pos[1] // TILESIZE)
+        if 0 <= x_pos < self._tilewidth and 0 <= y_pos < self._tileheight:
+            return self._region_ids[y_pos * self._tilewidth + x_pos]
+        return 0
+
     def get_current_room(self, pos):
         """Returns the room that encloses any given pos"""
-        tile_pos = pos[0] // TILESIZE, pos[1] // TILESIZE
-        for room in self._generator_rooms:
-            if room.get_x() < tile_pos[0] < room.get_end_x():
-                if room.get_y() < tile_pos[1] < room.get_end_y():
-                    return room
+        region_id = self._get_region_id(pos)
+        if 0 < region_id <= len(self._generator_rooms):
+            return self._regions[region_id - 1]
         return False
 
     def get_current_corridor(self, pos):
         """Returns the corridor that encloses any given pos"""
-        tile_pos = pos[0] // TILESIZE, pos[1] // TILESIZE
-        for corridor in self._generator_corridors:
-            if corridor.get_x() < tile_pos[0] < corridor.get_end_x():
-                if corridor.get_y() < tile_pos[1] < corridor.get_end_y():
-                    return corridor
+        region_id = self._get_region_id(pos)
+        if region_id > len(self._generator_rooms):
+            return self._regions[region_id - 1]
+        # Corridor ends inside room walls are indexed as the room, so only those tiles need a scan
+        if region_id:
+            tile_pos = pos[0] // TILESIZE, pos[1] // TILESIZE
+            for corridor in self._generator_corridors:
+                if corridor.get_x() < tile_pos[0] < corridor.get_end_x():
+                    if corridor.get_y() < tile_pos[1] < corridor.get_end_y():
+                        return corridor
         return False
 
     def get_room_or_corridor(self, pos):
-        room = self.get_current_room(pos)
-        if room:
-            return room
-        else:
-            return  self.get_current_corridor(pos)
+        """Returns the room or else the corridor that encloses any given pos, via a single lookup"""
+        region_id = self._get_region_id(pos)
+        if region_id:
+            return self._regions[region_id - 1]
+        return False
+
+    def get_rooms_or_corridors(self, positions):
+        """Returns the room or corridor enclosing each of the given positions, False for those outside any region"""
+        regions = [False, *self._regions]
+        region_ids = self._region_ids
+        tilewidth = self._tilewidth
+        tileheight = self._tileheight
+        found = []
+        for pos in positions:
+            x_pos = int(pos[0] // TILESIZE)
+            y_pos = int(pos[1] // TILESIZE)
+            if 0 <= x_pos < tilewidth and 0 <= y_pos < tileheight:
+                found.append(regions[region_ids[y_pos * tilewidth + x_pos]])
+            else:
+                found.append(False)
+        return found
 
     def get_connected_rooms_corridors(self, pos):
         """Returns the connected rooms and corridors that surround a given pos"""
         room = self.get_current_room(pos)
         if not room:
             corridor = self.get_current_corridor(pos)
-            return [*self._adjacent_matrix.get_connected_nodes(corridor)]
+            return [*self._adjacency_graph.get_connected_nodes(corridor)]
         else:
-            return self._adjacent_matrix.get_connected_edges(room)
+            return self._adjacency_graph.get_connected_edges(room)
+
+    def get_neighbourhood(self, region, hops=NEIGHBOURHOODHOPS):
+        """Returns the rooms and corridors within a number of hops of a room or corridor, including itself"""
+        return self._adjacency_graph.get_neighbourhood(region, hops)
+
+    def _load_occluders(self):
+        """Merges the corners, separates the edges and packs the edges of every room and corridor within
+        NEIGHBOURHOODHOPS of each room or corridor, once per level so that moving between rooms needs no geometry work"""
+        occluders = {}
+        for region in self._regions:
+            corners = []
+            edges = []
+            for near_region in self.get_neighbourhood(region):
+                region_corners = get_corners(near_region)
+                corners.extend(region_corners)
+                edges.extend(get_edges(region_corners))
+            edges = separate_edges(edges)
+            occluders[region] = corners, edges, pack_edges(edges)
+        return occluders
+
+    def get_occluders(self, region):
+        """Returns the precomputed corners, edges and packed edges around a room or corridor, shared between calls"""
+        return self._occluders[region]
 
     def is_adjacent(self, room1, room2):
-        self._adjacent_matrix.test_adjacent(room1, room2)
+        return self._adjacency_graph.test_adjacent(room1, room2)
 
     def _load_walls(self, game):
-        for rno, row in enumerate(self._map_layout):
-            for cno, char in enumerate(row):
-                if char == "#":
-                    game.walls.add(Wall(game, cno, rno))
+        for index, passable in enumerate(self._grid.get_cells()):
+            if not passable:
+                cno, rno = self._grid.get_pos(index)
+                wall = Wall(game, cno, rno)
+                game.walls.add(wall)
+                self._walls_by_index[index] = wall
+
+    def get_colliding_wall(self, x, y, width, height):
+        """Returns a wall overlapping the rectangle at pixel position x, y of given size (None if no wall)
+        Only the tiles the rectangle covers are checked, in the same row by row order walls were loaded in"""
+        start_x = max(int(x // TILESIZE), 0)
+        end_x = min(int(-((-x - width) // TILESIZE)) - 1, self._tilewidth - 1)
+        start_y = max(int(y // TILESIZE), 0)
+        end_y = min(int(-((-y - height) // TILESIZE)) - 1, self._tileheight - 1)
+        cells = self._grid.get_cells()
+        for tile_y in range(start_y, end_y + 1):
+            for tile_x in range(start_x, end_x + 1):
+                index = self._grid.get_index(tile_x, tile_y)
+                if not cells[index]:
+                    return self._walls_by_index[index]
+        return None
 
     def _load_internals(self, game):
         """Places all enemies, crated and exits in the level"""
@@ -364,7 +472,7 @@ class Map:
             enemy_positions = []
             while enemy_count < num_enemies:
                 pos = self._get_random_pos(room)
-                if not pos in enemy_positions:
+                if not pos in enemy_positions and self._grid.is_passable(*pos):
                     enemy_positions.append(pos)
                     enemy_count += 1
 